@@ -1,28 +1,71 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Response, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse, ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
-from typing import Optional, List
-from sqlalchemy.orm import Session
+from typing import Optional, List, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from .models.chat import Message, ChatRequest, ChatResponse, ModelsResponse, FileResponse as FileResponseModel, FileUploadResponse, FileListResponse
-from .services.llm_service import LLMModel
+from .services.llm_service import ModelRegistry
 from .services.file_service import FileService
 from .services.title_service import TitleGenerationService
+from .services.response_cache import ResponseCache
 from .services.rag.rag_pipeline import RAGPipeline
-from .database.database import get_db, init_database
+from .services.rag.document_processor import open_pdf, pdf_lock, close_cached_pdf
+from .database.database import get_db, init_database, optimize_database, SessionLocal
 from .repositories.chat_repository import ChatRepository
 from .repositories.file_repository import FileRepository
 from .database.models import Conversation, Message as DBMessage, File as DBFile
+from .core.config import settings
+from .core.logger import setup_logging
 import os
+import json
+import hashlib
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote
 from datetime import datetime
 from pathlib import Path
 
-app = FastAPI()
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+try:
+    import httptools
+    HTTPTOOLS_AVAILABLE = True
+except ImportError:
+    HTTPTOOLS_AVAILABLE = False
+
+# Debug output only in development; production keeps warnings and errors
+if settings.ENVIRONMENT != "development":
+    setup_logging(logging.WARNING)
+else:
+    setup_logging(logging.DEBUG if settings.DEBUG else logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Compress larger JSON payloads (conversation and file listings)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 # Initialize services and models
-llm_model = LLMModel()
+model_registry = ModelRegistry()
 file_service = FileService()
 title_service = TitleGenerationService()
 rag_pipeline = RAGPipeline()
+response_cache = ResponseCache()
+
+# Embedding and vector search are CPU bound; keep them off the event loop
+rag_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="rag")
+
+async def run_rag(func, *args, **kwargs):
+    """Run a blocking RAG pipeline call in the RAG thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(rag_executor, partial(func, *args, **kwargs))
 
 @app.get("/health")
 async def health_check():
@@ -31,107 +74,214 @@ async def health_check():
 
 @app.on_event("startup")
 async def startup_event():
-    init_database()
-    print("✅ Database initialized")
+    await init_database()
+    logger.info("Database initialized")
     
     # Initialize RAG pipeline
     try:
         rag_pipeline.initialize()
-        print("✅ RAG pipeline initialized")
+        logger.info("RAG pipeline initialized")
     except Exception as e:
-        print(f"⚠️ RAG pipeline initialization failed: {e}")
-        print("📄 File processing will work without RAG features")
+        logger.warning("RAG pipeline initialization failed: %s", e)
+        logger.warning("File processing will work without RAG features")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    rag_executor.shutdown(wait=False)
+    
+    # Let SQLite refresh statistics for the queries this process ran
+    try:
+        await optimize_database()
+    except Exception as e:
+        logger.warning("PRAGMA optimize failed: %s", e)
+
+# Titles that mark a conversation as still unnamed
+DEFAULT_TITLES = frozenset({"New Conversation", "Yeni Sohbet"})
+
+# RAG prompt assembly
+RAG_CONTEXT_MAX_CHARS = 500
+RAG_CONTEXT_SEPARATOR = "\n\n---\n\n"
+RAG_PROMPT_TEMPLATE = """Based on the following relevant information from uploaded documents, please answer the user's question:
+
+RELEVANT CONTEXT:
+{context}
+
+USER QUESTION: {message}
+
+Please provide a comprehensive answer using the context above. If the context is relevant, reference the sources. If the context doesn't help answer the question, just answer normally."""
+# Sent instead of the full prompt when the same chunks are already in the conversation's Ollama context
+RAG_FOLLOWUP_TEMPLATE = """Using the same relevant context from the uploaded documents as above, please answer the user's question:
+
+USER QUESTION: {message}"""
+
+def format_context_part(source: str, content: str) -> str:
+    """Format one retrieved chunk, truncated to RAG_CONTEXT_MAX_CHARS"""
+    if len(content) > RAG_CONTEXT_MAX_CHARS:
+        content = content[:RAG_CONTEXT_MAX_CHARS] + "..."
+    return f"[Source: {source}]\n{content}"
+
+def build_rag_message(message: str) -> Tuple[str, Optional[str]]:
+    """Enhance a user message with relevant context from processed documents.
+
+    Returns the enhanced message and a key identifying the retrieved chunk set.
+    """
+    try:
+        # Skip the query embedding and vector search while nothing is indexed
+        if rag_pipeline.has_documents():
+            context_results = rag_pipeline.query_documents(
+                query=message,
+                top_k=5,
+                similarity_threshold=0.35
+            )
+            
+            if context_results:
+                context_text = RAG_CONTEXT_SEPARATOR.join([
+                    format_context_part(result.metadata.get('filename', 'Unknown source'), result.content.strip())
+                    for result in context_results
+                ])
+                chunk_ids = "|".join(sorted(result.document_id for result in context_results))
+                context_key = hashlib.sha256(chunk_ids.encode("utf-8")).hexdigest()
+                return RAG_PROMPT_TEMPLATE.format(context=context_text, message=message), context_key
+            
+    except Exception:
+        pass
+    
+    return message, None
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(request: ChatRequest, response: Response, background_tasks: BackgroundTasks,
+               db: AsyncSession = Depends(get_db)):
     """Handle chat requests with database persistence"""
     try:
         chat_repo = ChatRepository(db)
         
-        conversation = chat_repo.get_or_create_conversation(request.conversation_id)
+        conversation = await chat_repo.get_or_create_conversation(request.conversation_id)
         
         # Add user message to database
-        user_message = chat_repo.add_message(conversation.id, "user", request.message)
+        user_message_id = await chat_repo.add_message(conversation.id, "user", request.message,
+                                                      snapshot=conversation)
         
         # Get conversation history for LLM context
-        messages = chat_repo.get_conversation_messages(conversation.id)
-        history = [{"role": msg.role, "content": msg.content} for msg in messages[:-1]]  
+        history = await chat_repo.get_history_for_llm(conversation.id, exclude_message_id=user_message_id)
         
-        # If a specific model is requested, update the model
-        if request.model_name and request.model_name != llm_model.model_name:
-            llm_model.__init__(model_name=request.model_name)
+        # Use the requested model for this request only
+        current = model_registry.get(request.model_name)
         
-        llm_model.history = history
+        enhanced_message, context_key = await run_rag(build_rag_message, request.message)
+        followup_message = RAG_FOLLOWUP_TEMPLATE.format(message=request.message) if context_key else None
         
-        enhanced_message = request.message
+        # Only greedy decoding is reproducible enough to serve a stored reply
+        cache_key = None
+        llm_response = None
+        if current.temperature == 0:
+            cache_key = ResponseCache.build_key(current.model_name, enhanced_message, history)
+            llm_response = await response_cache.get(cache_key)
         
-        try:
-            if rag_pipeline:
-                context_results = rag_pipeline.query_documents(
-                    query=request.message,
-                    top_k=5,
-                    similarity_threshold=0.35
-                )
-                
-                if context_results:
-                    context_parts = []
-                    for result in context_results:
-                        source = result.metadata.get('filename', 'Unknown source')
-                        content = result.content.strip()
-                        
-                        if len(content) > 500:
-                            content = content[:500] + "..."
-                        context_parts.append(f"[Source: {source}]\n{content}")
-                    
-                    if context_parts:
-                        context_text = "\n\n---\n\n".join(context_parts)
-                        enhanced_message = f"""Based on the following relevant information from uploaded documents, please answer the user's question:
-
-RELEVANT CONTEXT:
-{context_text}
-
-USER QUESTION: {request.message}
-
-Please provide a comprehensive answer using the context above. If the context is relevant, reference the sources. If the context doesn't help answer the question, just answer normally."""
-                
-        except Exception:
-            pass
-        
-        llm_response = llm_model.get_response(enhanced_message)
-        
-        if isinstance(llm_response, dict) and 'text' in llm_response:
-            llm_response = llm_response['text']
+        if llm_response is not None:
+            response.headers["X-Cache"] = "HIT"
+            # The conversation's Ollama context does not contain this turn
+            current.drop_session(conversation.id)
+        else:
+            response.headers["X-Cache"] = "MISS" if cache_key else "BYPASS"
+            llm_response = await asyncio.to_thread(current.continue_response, conversation.id, enhanced_message,
+                                                   history, context_key, followup_message)
+            
+            if cache_key and not current.is_error_response(llm_response):
+                await response_cache.set(cache_key, llm_response)
         
-        # Add assistant response to database
-        assistant_message = chat_repo.add_message(conversation.id, "assistant", llm_response)
+        # Store the reply and bump the conversation in one transaction
+        assistant_message_id = await chat_repo.finalize_turn(conversation.id, llm_response, snapshot=conversation)
         
-
-        if (conversation.title == "New Conversation" or conversation.title == "Yeni Sohbet") and len(messages) <= 2:
-            try:
-                new_title = title_service.update_conversation_title(
-                    conversation.id, 
-                    request.message, 
-                    chat_repo
-                )
-                if new_title:
-                    print(f"✅ Generated title for conversation {conversation.id}: {new_title}")
-            except Exception as e:
-                print(f"⚠️ Title generation failed: {e}")
+        # Generate the title after the response has been sent
+        if conversation.title in DEFAULT_TITLES and conversation.message_count <= 2:
+            background_tasks.add_task(generate_title_in_background, conversation.id, request.message)
         
         return ChatResponse(
             response=llm_response,
             conversation_id=conversation.id,
-            message_id=assistant_message.id
+            message_id=assistant_message_id
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    """Stream chat response tokens as Server-Sent Events"""
+    try:
+        chat_repo = ChatRepository(db)
+        
+        conversation = await chat_repo.get_or_create_conversation(request.conversation_id)
+        
+        # Add user message to database
+        user_message_id = await chat_repo.add_message(conversation.id, "user", request.message,
+                                                      snapshot=conversation)
+        
+        # Get conversation history for LLM context
+        history = await chat_repo.get_history_for_llm(conversation.id, exclude_message_id=user_message_id)
+        
+        # Use the requested model for this request only
+        current = model_registry.get(request.model_name)
+        
+        enhanced_message, context_key = await run_rag(build_rag_message, request.message)
+        followup_message = RAG_FOLLOWUP_TEMPLATE.format(message=request.message) if context_key else None
+        needs_title = conversation.title in DEFAULT_TITLES and conversation.message_count <= 2
+        tokens = []
+        
+        def event_stream():
+            for token in current.stream_response(conversation.id, enhanced_message, history,
+                                                 context_key, followup_message):
+                tokens.append(token)
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield "data: [DONE]\n\n"
+        
+        # Persist the assembled reply after the last token has been sent
+        background_tasks.add_task(
+            save_streamed_response, conversation.id, tokens,
+            request.message if needs_title else None
+        )
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"X-Conversation-Id": str(conversation.id)}
         )
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def save_streamed_response(conversation_id: int, tokens: List[str], title_message: Optional[str] = None):
+    """Save a streamed assistant reply and generate the conversation title if needed"""
+    if not tokens:
+        return
+    
+    async with SessionLocal() as db:
+        chat_repo = ChatRepository(db)
+        await chat_repo.finalize_turn(conversation_id, "".join(tokens))
+    
+    if title_message:
+        await generate_title_in_background(conversation_id, title_message)
+
+async def generate_title_in_background(conversation_id: int, message: str):
+    """Generate and store a conversation title outside the request's session"""
+    async with SessionLocal() as db:
+        chat_repo = ChatRepository(db)
+        try:
+            new_title = await title_service.update_conversation_title(
+                conversation_id, 
+                message, 
+                chat_repo
+            )
+            if new_title:
+                logger.info("Generated title for conversation %s: %s", conversation_id, new_title)
+        except Exception as e:
+            logger.warning("Title generation failed: %s", e)
+
 @app.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
     file: UploadFile = File(...), 
     conversation_id: Optional[int] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload a file with optional conversation association"""
     try:
@@ -146,17 +296,22 @@ async def upload_file(
                 file=None
             )
         
-        # Save file to storage
-        file_path, file_hash, file_size = await file_service.save_file(file)
+        # Stream file to a temporary location while hashing it
+        temp_path, file_hash, file_size = await file_service.stream_to_temp(file)
         
+        # Reuse stored content for byte-identical uploads
+        existing_path = await file_repo.get_stored_path_by_hash(file_hash)
+        if existing_path and await asyncio.to_thread(os.path.exists, existing_path):
+            file_service.discard_temp_file(temp_path)
+            file_path = existing_path
+        else:
+            file_path = await asyncio.to_thread(file_service.store_temp_file, temp_path, file.filename, file_hash)
         
         # Detect MIME type
-        import mimetypes
-        mime_type, _ = mimetypes.guess_type(file.filename)
-        mime_type = mime_type or file.content_type
+        mime_type = file_service.detect_mime_type(file.filename, file.content_type)
         
         # Save file metadata to database
-        db_file = file_repo.create_file(
+        db_file = await file_repo.create_file(
             filename=file.filename,
             file_path=file_path,
             file_size=file_size,
@@ -179,17 +334,15 @@ async def upload_file(
         )
         
     except Exception as e:
-        import traceback
-        print(f"File upload error: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("File upload error: %s", e)
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
 @app.get("/files", response_model=FileListResponse)
-async def get_files(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+async def get_files(skip: int = 0, limit: int = 50, db: AsyncSession = Depends(get_db)):
     """Get all uploaded files"""
     try:
         file_repo = FileRepository(db)
-        files = file_repo.get_all_files(skip=skip, limit=limit)
+        files = await file_repo.get_all_files(skip=skip, limit=limit)
         
         file_list = [
             FileResponseModel(
@@ -209,11 +362,11 @@ async def get_files(skip: int = 0, limit: int = 50, db: Session = Depends(get_db
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/files/{file_id}", response_model=FileResponseModel)
-async def get_file_info(file_id: int, db: Session = Depends(get_db)):
+async def get_file_info(file_id: int, db: AsyncSession = Depends(get_db)):
     """Get file information by ID"""
     try:
         file_repo = FileRepository(db)
-        file = file_repo.get_file(file_id)
+        file = await file_repo.get_file(file_id)
         
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
@@ -233,20 +386,39 @@ async def get_file_info(file_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/files/{file_id}/download")
-async def download_file(file_id: int, db: Session = Depends(get_db)):
+async def download_file(file_id: int, db: AsyncSession = Depends(get_db)):
     """Download a file"""
     try:
         file_repo = FileRepository(db)
-        file = file_repo.get_file(file_id)
+        file = await file_repo.get_file(file_id)
         
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
         
+        # Let nginx send the file with sendfile(2) when it fronts the API
+        if settings.X_ACCEL_REDIRECT_PREFIX:
+            return Response(
+                media_type=file.mime_type,
+                headers={
+                    "X-Accel-Redirect": file_service.get_internal_redirect_path(
+                        file.file_path, settings.X_ACCEL_REDIRECT_PREFIX
+                    ),
+                    "Content-Disposition": f"attachment; filename*=utf-8''{quote(file.filename)}"
+                }
+            )
+        
+        # Stat up front so a missing file is a 404 and Content-Length is set before streaming
+        try:
+            stat_result = await asyncio.to_thread(os.stat, file.file_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found in storage")
+        
         # Return file response
         return FileResponse(
             path=file.file_path,
             filename=file.filename,
-            media_type=file.mime_type
+            media_type=file.mime_type,
+            stat_result=stat_result
         )
         
     except Exception as e:
@@ -255,24 +427,27 @@ async def download_file(file_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/files/{file_id}")
-async def delete_file(file_id: int, db: Session = Depends(get_db)):
+async def delete_file(file_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a file"""
     try:
         file_repo = FileRepository(db)
-        file = file_repo.get_file(file_id)
+        file = await file_repo.get_file(file_id)
         
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Delete from storage
-        storage_deleted = await file_service.delete_file(file.file_path)
-        
         # Delete from database
-        db_deleted = file_repo.delete_file(file_id)
+        db_deleted = await file_repo.delete_file(file_id)
         
         if not db_deleted:
             raise HTTPException(status_code=500, detail="Failed to delete file from database")
         
+        # Delete from storage unless other uploads share the same content
+        storage_deleted = False
+        if await file_repo.count_files_by_path(file.file_path) == 0:
+            close_cached_pdf(file.file_path)
+            storage_deleted = await file_service.delete_file(file.file_path)
+        
         return {
             "status": "success", 
             "message": "File deleted successfully",
@@ -285,11 +460,11 @@ async def delete_file(file_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/conversations/{conversation_id}/files", response_model=FileListResponse)
-async def get_conversation_files(conversation_id: int, skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+async def get_conversation_files(conversation_id: int, skip: int = 0, limit: int = 50, db: AsyncSession = Depends(get_db)):
     """Get all files for a specific conversation"""
     try:
         file_repo = FileRepository(db)
-        files = file_repo.get_files_by_conversation(conversation_id, skip=skip, limit=limit)
+        files = await file_repo.get_files_by_conversation(conversation_id, skip=skip, limit=limit)
         
         file_list = [
             FileResponseModel(
@@ -326,28 +501,27 @@ async def get_supported_file_types():
 async def get_models():
     """Get available models"""
     try:
-        models = llm_model.get_available_models()
+        models = model_registry.get().get_available_models()
         return ModelsResponse(models=models)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/conversations")
-async def get_conversations(db: Session = Depends(get_db)):
+async def get_conversations(db: AsyncSession = Depends(get_db)):
     """Get all conversations"""
     try:
         chat_repo = ChatRepository(db)
-        conversations = chat_repo.get_conversations()
+        conversations = await chat_repo.get_conversations()
         
         conversation_list = []
         for conv in conversations:
-            message_count = len(chat_repo.get_conversation_messages(conv.id))
             conversation_list.append({
                 "id": conv.id,
                 "title": conv.title,
-                "created_at": conv.created_at.isoformat(),
-                "updated_at": conv.updated_at.isoformat(),
-                "message_count": message_count
+                "created_at": conv.created_at,
+                "updated_at": conv.updated_at,
+                "message_count": conv.message_count
             })
         
         return {"conversations": conversation_list}
@@ -356,16 +530,17 @@ async def get_conversations(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: int, db: Session = Depends(get_db)):
+async def get_conversation(conversation_id: int, db: AsyncSession = Depends(get_db)):
     """Get a specific conversation with messages"""
     try:
         chat_repo = ChatRepository(db)
-        conversation_data = chat_repo.get_conversation_with_messages(conversation_id)
+        conversation_json = await chat_repo.get_conversation_with_messages_json(conversation_id)
         
-        if not conversation_data:
+        if not conversation_json:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        return conversation_data
+        # Already serialized by SQLite; send as-is
+        return Response(content=conversation_json, media_type="application/json")
     
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -373,45 +548,45 @@ async def get_conversation(conversation_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/conversations")
-async def create_conversation(title: str = "New Conversation", db: Session = Depends(get_db)):
+async def create_conversation(title: str = "New Conversation", db: AsyncSession = Depends(get_db)):
     """Create a new conversation"""
     try:
         chat_repo = ChatRepository(db)
-        conversation = chat_repo.create_conversation(title)
+        conversation = await chat_repo.create_conversation(title)
         
         return {
             "id": conversation.id,
             "title": conversation.title,
-            "created_at": conversation.created_at.isoformat(),
-            "updated_at": conversation.updated_at.isoformat()
+            "created_at": conversation.created_at,
+            "updated_at": conversation.updated_at
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/conversations/{conversation_id}/generate-title")
-async def generate_conversation_title(conversation_id: int, db: Session = Depends(get_db)):
+async def generate_conversation_title(conversation_id: int, db: AsyncSession = Depends(get_db)):
     """Generate or regenerate a conversation title based on first message"""
     try:
         chat_repo = ChatRepository(db)
         
         # Get conversation messages
-        messages = chat_repo.get_conversation_messages(conversation_id)
+        messages = await chat_repo.get_conversation_history(conversation_id)
         if not messages:
             raise HTTPException(status_code=400, detail="No messages found to generate title from")
         
         # Find first user message
         first_user_message = None
-        for msg in messages:
-            if msg.role == "user":
-                first_user_message = msg.content
+        for role, content in messages:
+            if role == "user":
+                first_user_message = content
                 break
         
         if not first_user_message:
             raise HTTPException(status_code=400, detail="No user message found")
         
         # Generate and update title
-        new_title = title_service.update_conversation_title(
+        new_title = await title_service.update_conversation_title(
             conversation_id, 
             first_user_message, 
             chat_repo
@@ -435,7 +610,7 @@ async def generate_conversation_title(conversation_id: int, db: Session = Depend
 async def update_conversation_title_manual(
     conversation_id: int, 
     title: str, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Manually update conversation title"""
     try:
@@ -449,7 +624,7 @@ async def update_conversation_title_manual(
             raise HTTPException(status_code=400, detail="Title too long (max 255 characters)")
         
         # Update title
-        updated_conversation = chat_repo.update_conversation_title(conversation_id, title.strip())
+        updated_conversation = await chat_repo.update_conversation_title(conversation_id, title.strip())
         
         if not updated_conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -466,15 +641,17 @@ async def update_conversation_title_manual(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
+async def delete_conversation(conversation_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a conversation"""
     try:
         chat_repo = ChatRepository(db)
-        success = chat_repo.delete_conversation(conversation_id)
+        success = await chat_repo.delete_conversation(conversation_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
+        model_registry.drop_session(conversation_id)
+        
         return {"status": "success", "message": "Conversation deleted"}
     
     except Exception as e:
@@ -483,15 +660,17 @@ async def delete_conversation(conversation_id: int, db: Session = Depends(get_db
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/conversations/{conversation_id}/clear")
-async def clear_conversation_history(conversation_id: int, db: Session = Depends(get_db)):
+async def clear_conversation_history(conversation_id: int, db: AsyncSession = Depends(get_db)):
     """Clear messages from a conversation"""
     try:
         chat_repo = ChatRepository(db)
-        success = chat_repo.clear_conversation_messages(conversation_id)
+        success = await chat_repo.clear_conversation_messages(conversation_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
+        model_registry.drop_session(conversation_id)
+        
         return {"status": "success", "message": "Conversation history cleared"}
     
     except Exception as e:
@@ -500,14 +679,13 @@ async def clear_conversation_history(conversation_id: int, db: Session = Depends
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/clear_history")
-async def clear_all_history(db: Session = Depends(get_db)):
+async def clear_all_history(db: AsyncSession = Depends(get_db)):
     """Clear all chat history"""
     try:
         chat_repo = ChatRepository(db)
-        conversations = chat_repo.get_conversations()
+        await chat_repo.delete_all()
         
-        for conv in conversations:
-            chat_repo.delete_conversation(conv.id)
+        model_registry.clear_sessions()
         
         return {"status": "success", "message": "All chat history cleared"}
     
@@ -516,11 +694,11 @@ async def clear_all_history(db: Session = Depends(get_db)):
 
 # RAG-related endpoints
 @app.post("/files/{file_id}/process")
-async def process_file_with_rag(file_id: int, db: Session = Depends(get_db)):
+async def process_file_with_rag(file_id: int, db: AsyncSession = Depends(get_db)):
     """Process uploaded file through RAG pipeline"""
     try:
         file_repo = FileRepository(db)
-        file = file_repo.get_file(file_id)
+        file = await file_repo.get_file(file_id)
         
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
@@ -529,18 +707,32 @@ async def process_file_with_rag(file_id: int, db: Session = Depends(get_db)):
         file_path = os.path.abspath(file.file_path)
         
         # Check if file exists
-        if not os.path.exists(file_path):
-            print(f"❌ File not found at path: {file_path}")
-            print(f"🔍 Original file path: {file.file_path}")
-            print(f"🔍 Current working directory: {os.getcwd()}")
+        if not await asyncio.to_thread(os.path.exists, file_path):
+            logger.warning("File not found at path: %s (stored path: %s, working directory: %s)",
+                           file_path, file.file_path, os.getcwd())
             return {
                 "status": "error",
                 "message": f"File not found at path: {file_path}",
                 "file_id": file_id
             }
         
-
-        result = rag_pipeline.process_document(file_path)
+        # Deduplicated uploads share stored content that may already be indexed
+        existing_chunks = await run_rag(rag_pipeline.count_document_chunks, file_path)
+        if existing_chunks:
+            return {
+                "status": "success",
+                "message": f"File already processed: {existing_chunks} chunks indexed",
+                "file_id": file_id,
+                "filename": file.filename,
+                "chunks_added": 0,
+                "existing_chunks": existing_chunks,
+                "already_processed": True
+            }
+        
+        # Chunks embedded by another model would sit next to the new ones
+        await run_rag(rag_pipeline.delete_stale_chunks, file_path)
+        
+        result = await run_rag(rag_pipeline.process_document, file_path)
         
         if result['success']:
             return {
@@ -571,7 +763,8 @@ async def search_context(query: str, top_k: int = 5, threshold: float = 0.0):
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
         # Search for relevant chunks
-        search_results = rag_pipeline.query_documents(
+        search_results = await run_rag(
+            rag_pipeline.query_documents,
             query=query.strip(),
             top_k=top_k,
             similarity_threshold=threshold
@@ -601,16 +794,22 @@ async def search_context(query: str, top_k: int = 5, threshold: float = 0.0):
 async def get_rag_stats():
     """Get RAG pipeline statistics"""
     try:
-        stats = rag_pipeline.get_pipeline_stats()
+        stats = await run_rag(rag_pipeline.get_pipeline_stats)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get RAG stats: {str(e)}")
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get response cache statistics"""
+    return response_cache.get_stats()
+
 @app.get("/rag/test/{query}")
 async def test_rag_query(query: str):
     """Test RAG query for debugging"""
     try:
-        context_results = rag_pipeline.query_documents(
+        context_results = await run_rag(
+            rag_pipeline.query_documents,
             query=query,
             top_k=5,
             similarity_threshold=0.1
@@ -633,83 +832,74 @@ async def test_rag_query(query: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG test failed: {str(e)}")
 
+def inspect_pdf_file(stored_path: str) -> dict:
+    """Resolve a stored file and test opening it with PyMuPDF (blocking)"""
+    file_path = os.path.abspath(stored_path)
+    exists = os.path.exists(file_path)
+    logger.debug("Absolute path: %s, working directory: %s, exists: %s", file_path, os.getcwd(), exists)
+    
+    if exists:
+        file_stat = os.stat(file_path)
+        logger.debug("File size: %d bytes, modified: %s", file_stat.st_size, file_stat.st_mtime)
+        
+        # Test PyMuPDF directly
+        try:
+            with pdf_lock():
+                pdf_doc = open_pdf(file_path)
+                logger.debug("PyMuPDF opened successfully: %d pages", len(pdf_doc))
+                
+                if len(pdf_doc) > 0:
+                    text = pdf_doc.load_page(0).get_text()
+                    logger.debug("First page text length: %d, first 200 chars: %s", len(text), text[:200])
+            
+        except Exception:
+            logger.exception("PyMuPDF failed")
+    
+    return {
+        "absolute_path": file_path,
+        "exists": exists,
+        "working_dir": os.getcwd()
+    }
+
 @app.get("/debug/pdf/{file_id}")
-async def debug_pdf_processing(file_id: int, db: Session = Depends(get_db)):
+async def debug_pdf_processing(file_id: int, db: AsyncSession = Depends(get_db)):
     """Debug PDF processing step by step"""
     try:
         file_repo = FileRepository(db)
-        file = file_repo.get_file(file_id)
+        file = await file_repo.get_file(file_id)
         
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
         
-        print(f"🔍 Debug PDF Processing for file ID: {file_id}")
-        print(f"📋 Database record:")
-        print(f"  - filename: {file.filename}")
-        print(f"  - file_path: {file.file_path}")
-        print(f"  - file_size: {file.file_size}")
-        print(f"  - mime_type: {file.mime_type}")
+        logger.debug("Debug PDF processing for file %s: filename=%s, file_path=%s, file_size=%s, mime_type=%s",
+                     file_id, file.filename, file.file_path, file.file_size, file.mime_type)
         
-        # Check file path resolution
-        file_path = os.path.abspath(file.file_path)
-        print(f"📁 Absolute path: {file_path}")
-        print(f"📂 Working directory: {os.getcwd()}")
-        print(f"✅ File exists: {os.path.exists(file_path)}")
-        
-        if os.path.exists(file_path):
-            print(f"📊 File info:")
-            file_stat = os.stat(file_path)
-            print(f"  - Size: {file_stat.st_size} bytes")
-            print(f"  - Modified: {file_stat.st_mtime}")
-            
-            # Test PyMuPDF directly
-            try:
-                import fitz
-                print(f"🔍 Testing PyMuPDF directly...")
-                pdf_doc = fitz.open(file_path)
-                print(f"✅ PyMuPDF opened successfully: {len(pdf_doc)} pages")
-                
-                if len(pdf_doc) > 0:
-                    page = pdf_doc.load_page(0)
-                    text = page.get_text()
-                    print(f"📄 First page text length: {len(text)}")
-                    print(f"📄 First 200 chars: {text[:200]}")
-                
-                pdf_doc.close()
-                
-            except Exception as e:
-                print(f"❌ PyMuPDF failed: {e}")
-                import traceback
-                print(f"📍 Traceback: {traceback.format_exc()}")
+        result = await run_rag(inspect_pdf_file, file.file_path)
         
         return {
             "file_id": file_id,
             "filename": file.filename,
             "file_path": file.file_path,
-            "absolute_path": file_path,
-            "exists": os.path.exists(file_path),
-            "working_dir": os.getcwd()
+            **result
         }
         
     except Exception as e:
-        print(f"❌ Debug failed: {e}")
-        import traceback
-        print(f"📍 Traceback: {traceback.format_exc()}")
+        logger.exception("Debug failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/rag/clear")
 async def clear_rag_database():
     """Clear all documents from RAG database (for testing)"""
     try:
-        stats_before = rag_pipeline.get_pipeline_stats()
-        print(f"🗑️ Clearing RAG database...")
-        print(f"📊 Before: {stats_before}")
+        stats_before = await run_rag(rag_pipeline.get_pipeline_stats)
+        logger.info("Clearing RAG database")
+        logger.debug("Before: %s", stats_before)
         
-        # Clear the vector store
-        rag_pipeline.vector_store.reset_collection()
+        # Clear the vector store and cached query results
+        await run_rag(rag_pipeline.reset_pipeline)
         
-        stats_after = rag_pipeline.get_pipeline_stats()
-        print(f"📊 After: {stats_after}")
+        stats_after = await run_rag(rag_pipeline.get_pipeline_stats)
+        logger.debug("After: %s", stats_after)
         
         return {
             "status": "success",
@@ -718,12 +908,29 @@ async def clear_rag_database():
             "after": stats_after
         }
     except Exception as e:
-        print(f"❌ Failed to clear RAG database: {e}")
+        logger.error("Failed to clear RAG database: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to clear RAG database: {str(e)}")
 
 
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+def start_server(host="127.0.0.1", port=8000, workers=None):
+    """Run the API with uvicorn in one process unless WEB_CONCURRENCY asks for more.
+    
+    Worker processes share nothing in-process: each loads its own models, opens
+    its own Chroma client and keeps its own caches (LLM sessions, conversation
+    snapshots, file lookups, L1 response cache). Running several workers
+    therefore needs a vector store shared across processes (a Chroma server
+    rather than the embedded data/chroma_db) and REDIS_URL for the response cache.
+    """
+    workers = workers or settings.API_WORKERS
+    
+    uvicorn.run(
+        "backend.api:app" if workers > 1 else app,
+        host=host,
+        port=port,
+        workers=workers,
+        loop="uvloop" if UVLOOP_AVAILABLE else "auto",
+        http="httptools" if HTTPTOOLS_AVAILABLE else "auto"
+    )
 
-def start_server(host="127.0.0.1", port=8000):
-    uvicorn.run(app, host=host, port=port) 
\ No newline at end of file
+if __name__ == "__main__":
+    start_server(host="0.0.0.0", port=8000)
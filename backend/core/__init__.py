@@ -1,3 +1,4 @@
 from .config import Settings
+from .logger import setup_logging
 
-__all__ = ["Settings"] 
\ No newline at end of file
+__all__ = ["Settings", "setup_logging"] 
\ No newline at end of file
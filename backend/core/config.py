@@ -5,11 +5,35 @@ class Settings:
     """Application settings and configuration"""
     API_HOST: str = "127.0.0.1"
     API_PORT: int = 8000
+    # Opt in to more uvicorn workers with WEB_CONCURRENCY; they need a shared vector
+    # store, since the embedded Chroma store does not support several writing processes
+    API_WORKERS: int = 1
     
     # LLM Configuration
+    # Ollama tag; point at a quantized build to trade accuracy for speed,
+    # e.g. "llama3:8b-instruct-q4_K_M" or "llama3:8b-instruct-q8_0"
     DEFAULT_MODEL: str = "llama3"
     DEFAULT_TEMPERATURE: float = 0.7
     OLLAMA_BASE_URL: str = "http://localhost:11434"
+    MAX_LOADED_MODELS: int = 3
+    # Seconds to wait for Ollama to send data; bounds a full non-streaming generation
+    # and the gap between streamed chunks
+    OLLAMA_TIMEOUT: float = 300.0
+    
+    # Embedding runtime: "torch", or opt in to "onnx" (int8 quantized ONNX Runtime, falls back
+    # to PyTorch); the vectors differ slightly, so switching re-embeds processed files
+    EMBEDDING_BACKEND: str = "torch"
+    
+    # Response cache configuration
+    REDIS_URL: Optional[str] = None
+    RESPONSE_CACHE_TTL: int = 3600
+    
+    # Database connection pool, per worker process
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    
+    # Internal nginx location serving the upload directory (e.g. "/internal/files/")
+    X_ACCEL_REDIRECT_PREFIX: Optional[str] = None
     
     DEBUG: bool = True
     ENVIRONMENT: str = "development"
@@ -21,9 +45,18 @@ class Settings:
         
         settings.API_HOST = os.getenv("API_HOST", settings.API_HOST)
         settings.API_PORT = int(os.getenv("API_PORT", settings.API_PORT))
+        settings.API_WORKERS = int(os.getenv("WEB_CONCURRENCY", settings.API_WORKERS))
         settings.DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", settings.DEFAULT_MODEL)
         settings.DEFAULT_TEMPERATURE = float(os.getenv("DEFAULT_TEMPERATURE", settings.DEFAULT_TEMPERATURE))
         settings.OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", settings.OLLAMA_BASE_URL)
+        settings.OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", settings.OLLAMA_TIMEOUT))
+        settings.MAX_LOADED_MODELS = int(os.getenv("MAX_LOADED_MODELS", settings.MAX_LOADED_MODELS))
+        settings.EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", settings.EMBEDDING_BACKEND).lower()
+        settings.REDIS_URL = os.getenv("REDIS_URL", settings.REDIS_URL)
+        settings.RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", settings.RESPONSE_CACHE_TTL))
+        settings.DB_POOL_SIZE = int(os.getenv("POOL_SIZE", settings.DB_POOL_SIZE))
+        settings.DB_MAX_OVERFLOW = int(os.getenv("POOL_MAX_OVERFLOW", settings.DB_MAX_OVERFLOW))
+        settings.X_ACCEL_REDIRECT_PREFIX = os.getenv("X_ACCEL_REDIRECT_PREFIX", settings.X_ACCEL_REDIRECT_PREFIX)
         settings.DEBUG = os.getenv("DEBUG", "True").lower() == "true"
         settings.ENVIRONMENT = os.getenv("ENVIRONMENT", settings.ENVIRONMENT)
         
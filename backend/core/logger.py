@@ -0,0 +1,36 @@
+import sys
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# Loggers of this application (module loggers are named after their module)
+APP_LOGGER = __name__.split(".")[0]
+
+_listener = None
+
+def setup_logging(level: int = logging.INFO) -> None:
+    """Route log records through a queue so stderr writes happen on a background thread.
+
+    level applies to the application's loggers; libraries stay at WARNING or above.
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(max(level, logging.WARNING))
+    logging.getLogger(APP_LOGGER).setLevel(level)
@@ -1,43 +1,168 @@
 import os
-from sqlalchemy import create_engine
+import logging
+import sqlite3
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import OperationalError
 from ..core.config import settings
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# SQLite database URL
-SQLITE_DATABASE_URL = f"sqlite:///{os.path.join(DATA_DIR, 'catbot.db')}"
+# SQLite database file and async (aiosqlite) URL
+DATABASE_PATH = os.path.join(DATA_DIR, 'catbot.db')
+SQLITE_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+# Full-text search needs an SQLite build with the FTS5 extension
+try:
+    sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE fts5_probe USING fts5(x)")
+    FTS5_AVAILABLE = True
+except sqlite3.OperationalError:
+    FTS5_AVAILABLE = False
 
 # Create engine
-engine = create_engine(
-    SQLITE_DATABASE_URL, 
-    connect_args={"check_same_thread": False},  
-    echo=settings.DEBUG  
+engine = create_async_engine(
+    SQLITE_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    echo=False
 )
 
+# SQL statement logging goes through the app's log handlers (echo=True would add its own handler too)
+if settings.DEBUG and settings.ENVIRONMENT == "development":
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the single writer; NORMAL sync avoids an fsync per commit"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
 # Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
 
-def get_db():
+async def get_db():
     """Dependency to get database session"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def init_database():
+def add_message_count_column(sync_conn):
+    """Add and backfill conversations.message_count on databases created before it existed"""
+    columns = {column["name"] for column in inspect(sync_conn).get_columns("conversations")}
+    if "message_count" in columns:
+        return
+    sync_conn.exec_driver_sql(
+        "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0"
+    )
+    sync_conn.exec_driver_sql(
+        "UPDATE conversations SET message_count = "
+        "(SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id)"
+    )
+
+def add_hash_algorithm_column(sync_conn):
+    """Add files.hash_algorithm, marking rows hashed before the switch to BLAKE3 as SHA-256"""
+    columns = {column["name"] for column in inspect(sync_conn).get_columns("files")}
+    if "hash_algorithm" in columns:
+        return
+    sync_conn.exec_driver_sql(
+        "ALTER TABLE files ADD COLUMN hash_algorithm VARCHAR(16) NOT NULL DEFAULT 'blake3'"
+    )
+    sync_conn.exec_driver_sql("UPDATE files SET hash_algorithm = 'sha256'")
+
+# External-content FTS5 indexes over conversation titles and message text, kept in sync by triggers
+SEARCH_INDEX_TABLES = ("conversations_fts", "messages_fts")
+SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE conversations_fts USING fts5("
+    "title, content='conversations', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN "
+    "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE OF title ON conversations BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+)
+
+def create_search_index(sync_conn):
+    """Create the full-text search tables and triggers, indexing existing rows on first creation"""
+    if not FTS5_AVAILABLE:
+        return
+    if inspect(sync_conn).has_table("conversations_fts"):
+        return
+    for statement in SEARCH_INDEX_DDL:
+        sync_conn.exec_driver_sql(statement)
+    for table_name in SEARCH_INDEX_TABLES:
+        sync_conn.exec_driver_sql(f"INSERT INTO {table_name}({table_name}) VALUES ('rebuild')")
+
+def drop_search_index(sync_conn):
+    """Drop the full-text search tables (their triggers go with the base tables)"""
+    for table_name in SEARCH_INDEX_TABLES:
+        sync_conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table_name}")
+
+# Single-column indexes superseded by composite indexes with the same leading column
+SUPERSEDED_INDEXES = ("ix_messages_conversation_id", "ix_files_conversation_id")
+
+def create_tables_and_indexes(sync_conn):
+    """Create missing tables, then indexes added to tables that already exist"""
+    Base.metadata.create_all(sync_conn)
+    add_message_count_column(sync_conn)
+    add_hash_algorithm_column(sync_conn)
+    create_search_index(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+    for index_name in SUPERSEDED_INDEXES:
+        sync_conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+    # Let SQLite gather bounded statistics only for tables that lack or outgrew them;
+    # a full ANALYZE is left to `python -m backend.database.migrations analyze`
+    sync_conn.exec_driver_sql("PRAGMA analysis_limit=400")
+    sync_conn.exec_driver_sql("PRAGMA optimize=0x10002")
+
+async def init_database():
     """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
-    print(f"Database initialized at: {SQLITE_DATABASE_URL}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(create_tables_and_indexes)
+    except OperationalError:
+        # Another worker process created the tables concurrently
+        async with engine.begin() as conn:
+            await conn.run_sync(create_tables_and_indexes)
+    logging.getLogger(__name__).info("Database initialized at: %s", SQLITE_DATABASE_URL)
+
+async def optimize_database(analyze: bool = False):
+    """Refresh query planner statistics (full ANALYZE, or PRAGMA optimize's incremental pass)"""
+    async with engine.begin() as conn:
+        if analyze:
+            await conn.exec_driver_sql("ANALYZE")
+        await conn.exec_driver_sql("PRAGMA optimize")
 
-def reset_database():
+async def reset_database():
     """Reset database (delete all data)"""
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    print("Database reset completed") 
\ No newline at end of file
+    async with engine.begin() as conn:
+        await conn.run_sync(drop_search_index)
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(create_tables_and_indexes)
+    logging.getLogger(__name__).info("Database reset completed")
@@ -1,15 +1,16 @@
 import os
 import sys
-from .database import init_database, reset_database, SQLITE_DATABASE_URL
+import asyncio
+from .database import init_database, reset_database, optimize_database, SQLITE_DATABASE_URL, DATABASE_PATH
 from .models import Conversation, Message
 
-def setup_database():
+async def setup_database():
     try:
         print("Setting up CatBot database...")
         print(f"Database location: {SQLITE_DATABASE_URL}")
         
         # Initialize database tables
-        init_database()
+        await init_database()
         
         print("✅ Database setup completed successfully!")
         print("\nDatabase schema created:")
@@ -22,14 +23,14 @@ def setup_database():
         print(f"❌ Database setup failed: {e}")
         return False
 
-def reset_all_data():
+async def reset_all_data():
     """Reset database"""
     try:
         print("⚠️  WARNING: This will delete ALL chat history!")
         confirm = input("Type 'yes' to confirm: ")
         
         if confirm.lower() == 'yes':
-            reset_database()
+            await reset_database()
             print("✅ Database reset completed!")
             return True
         else:
@@ -40,11 +41,10 @@ def reset_all_data():
         print(f"❌ Database reset failed: {e}")
         return False
 
-def check_database():
+async def check_database():
     """Check if database exists and is properly set up"""
     try:
-        # Extract file path from sqlite URL
-        db_file = SQLITE_DATABASE_URL.replace("sqlite:///", "")
+        db_file = DATABASE_PATH
         
         if not os.path.exists(db_file):
             print(f"❌ Database file not found: {db_file}")
@@ -53,8 +53,8 @@ def check_database():
         from .database import engine
         from sqlalchemy import inspect
         
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
+        async with engine.connect() as conn:
+            tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
         
         required_tables = ['conversations', 'messages']
         missing_tables = [table for table in required_tables if table not in tables]
@@ -73,6 +73,17 @@ def check_database():
         print(f"❌ Database check failed: {e}")
         return False
 
+async def analyze_database():
+    """Refresh query planner statistics"""
+    try:
+        await optimize_database(analyze=True)
+        print("✅ Database statistics updated")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Database analyze failed: {e}")
+        return False
+
 if __name__ == "__main__":
     """Run migration script directly"""
     
@@ -80,16 +91,19 @@ if __name__ == "__main__":
         command = sys.argv[1]
         
         if command == "setup":
-            setup_database()
+            asyncio.run(setup_database())
         elif command == "reset":
-            reset_all_data()
+            asyncio.run(reset_all_data())
         elif command == "check":
-            check_database()
+            asyncio.run(check_database())
+        elif command == "analyze":
+            asyncio.run(analyze_database())
         else:
-            print("Unknown command. Use: setup, reset, or check")
+            print("Unknown command. Use: setup, reset, check, or analyze")
     else:
         print("CatBot Database Migration Tool")
         print("Commands:")
         print("  python -m backend.database.migrations setup  - Set up database")
         print("  python -m backend.database.migrations check  - Check database")
+        print("  python -m backend.database.migrations analyze  - Refresh query planner statistics")
         print("  python -m backend.database.migrations reset  - Reset database (deletes all data)") 
\ No newline at end of file
@@ -1,18 +1,23 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, BigInteger, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
 
+# Digest algorithm of new uploads; the file_hash of a row is only comparable within its hash_algorithm
+CONTENT_HASH_ALGORITHM = "blake3"
+
 class Conversation(Base):
     __tablename__ = "conversations"
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False, default="New Conversation")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")  # Maintained by ChatRepository
     
     # Relationship with messages
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan",
+                            order_by="Message.timestamp")
     
     # Relationship with files
     files = relationship("File", back_populates="conversation", cascade="all, delete-orphan")
@@ -24,7 +29,7 @@ class Message(Base):
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String(20), nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
@@ -32,6 +37,13 @@ class Message(Base):
     # Relationship with conversation
     conversation = relationship("Conversation", back_populates="messages")
     
+    # History queries filter by conversation and order by time or insertion id;
+    # the composites also serve plain conversation_id lookups as a left prefix
+    __table_args__ = (
+        Index("ix_messages_conversation_timestamp", "conversation_id", "timestamp"),
+        Index("ix_messages_conv_id_id", "conversation_id", "id"),
+    )
+    
     def __repr__(self):
         return f"<Message(id={self.id}, role='{self.role}', conversation_id={self.conversation_id})>"
     
@@ -52,13 +64,20 @@ class File(Base):
     file_path = Column(String(500), nullable=False)
     file_size = Column(BigInteger, nullable=False)
     mime_type = Column(String(100), nullable=False)
-    file_hash = Column(String(64), nullable=False, index=True)  # SHA256 hash
+    file_hash = Column(String(64), nullable=False, index=True)  # hex content digest
+    hash_algorithm = Column(String(16), nullable=False, default=CONTENT_HASH_ALGORITHM, server_default=CONTENT_HASH_ALGORITHM)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
-    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True)
     
     # Relationship with conversation
     conversation = relationship("Conversation", back_populates="files")
     
+    # Conversation file listings order by upload time; size totals are read from the index alone
+    __table_args__ = (
+        Index("ix_files_conv_uploaded", "conversation_id", "uploaded_at"),
+        Index("ix_files_conv_size", "conversation_id", "file_size"),
+    )
+    
     def __repr__(self):
         return f"<File(id={self.id}, filename='{self.filename}', size={self.file_size})>"
     
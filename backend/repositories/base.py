@@ -1,49 +1,61 @@
-from typing import TypeVar, Generic, Type, List, Optional
-from sqlalchemy.orm import Session
+from typing import TypeVar, Generic, Type, List, Optional, Dict, Any
+from sqlalchemy import select, func, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database.database import Base
 
 ModelType = TypeVar("ModelType", bound=Base)
 
-class BaseRepository(Generic[ModelType]):    
-    def __init__(self, model: Type[ModelType], db: Session):
+class BaseRepository(Generic[ModelType]):
+    def __init__(self, model: Type[ModelType], db: AsyncSession):
         self.model = model
         self.db = db
-    
-    def get(self, id: int) -> Optional[ModelType]:
+
+    async def get(self, id: int) -> Optional[ModelType]:
         """Get a single record by ID"""
-        return self.db.query(self.model).filter(self.model.id == id).first()
-    
-    def get_all(self, skip: int = 0, limit: int = 100) -> List[ModelType]:
+        result = await self.db.execute(select(self.model).filter(self.model.id == id))
+        return result.scalars().first()
+
+    async def get_all(self, skip: int = 0, limit: int = 100) -> List[ModelType]:
         """Get all records with pagination"""
-        return self.db.query(self.model).offset(skip).limit(limit).all()
-    
-    def create(self, **kwargs) -> ModelType:
-        """Create a new record"""
-        obj = self.model(**kwargs)
-        self.db.add(obj)
-        self.db.commit()
-        self.db.refresh(obj)
+        result = await self.db.execute(select(self.model).offset(skip).limit(limit))
+        return result.scalars().all()
+
+    async def create(self, **kwargs) -> ModelType:
+        """Create a new record, reading server defaults back with RETURNING instead of a refresh"""
+        result = await self.db.execute(insert(self.model).values(**kwargs).returning(self.model))
+        obj = result.scalar_one()
+        await self.db.commit()
         return obj
-    
-    def update(self, id: int, **kwargs) -> Optional[ModelType]:
-        """Update a record by ID"""
-        obj = self.get(id)
-        if obj:
-            for key, value in kwargs.items():
-                setattr(obj, key, value)
-            self.db.commit()
-            self.db.refresh(obj)
+
+    async def create_many(self, rows: List[Dict[str, Any]], commit: bool = True) -> int:
+        """Insert many records with one executemany statement and a single commit"""
+        if rows:
+            await self.db.execute(insert(self.model), rows)
+            if commit:
+                await self.db.commit()
+        return len(rows)
+
+    async def update(self, id: int, **kwargs) -> Optional[ModelType]:
+        """Update a record by ID with a single UPDATE ... RETURNING"""
+        result = await self.db.execute(update(self.model)
+                                       .where(self.model.id == id)
+                                       .values(**kwargs)
+                                       .returning(self.model)
+                                       .execution_options(populate_existing=True))
+        obj = result.scalars().first()
+        await self.db.commit()
         return obj
-    
-    def delete(self, id: int) -> bool:
+
+    async def delete(self, id: int) -> bool:
         """Delete a record by ID"""
-        obj = self.get(id)
+        obj = await self.get(id)
         if obj:
-            self.db.delete(obj)
-            self.db.commit()
+            await self.db.delete(obj)
+            await self.db.commit()
             return True
         return False
-    
-    def count(self) -> int:
+
+    async def count(self) -> int:
         """Count all records"""
-        return self.db.query(self.model).count() 
\ No newline at end of file
+        result = await self.db.execute(select(func.count()).select_from(self.model))
+        return result.scalar_one()
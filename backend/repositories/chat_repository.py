@@ -1,105 +1,244 @@
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, select, delete, insert, update, text, lambda_stmt
+from sqlalchemy.orm import selectinload
 from .base import BaseRepository
-from ..database.models import Conversation, Message
+from .file_repository import clear_file_cache
+from ..database.database import FTS5_AVAILABLE
+from ..database.models import Conversation, Message, File
 
-class ChatRepository:    
-    def __init__(self, db: Session):
+@dataclass
+class ConversationSnapshot:
+    id: int
+    title: str
+    message_count: int
+    updated_at: Optional[datetime]
+
+# Stored timestamps rendered like datetime.isoformat(): server defaults are stored to the second and
+# Python datetimes with six fraction digits, which isoformat() only prints when they are not all zero
+_ISO_TIMESTAMP = ("CASE WHEN substr({column}, 20) IN ('', '.000000') "
+                  "THEN replace(substr({column}, 1, 19), ' ', 'T') ELSE replace({column}, ' ', 'T') END")
+
+class ChatRepository:
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.conversation_repo = BaseRepository(Conversation, db)
         self.message_repo = BaseRepository(Message, db)
-    
+
     # Conversation operations
-    def create_conversation(self, title: str = "New Conversation") -> Conversation:
+    async def create_conversation(self, title: str = "New Conversation") -> Conversation:
         """Create a new conversation"""
-        return self.conversation_repo.create(title=title)
-    
-    def get_conversation(self, conversation_id: int) -> Optional[Conversation]:
+        return await self.conversation_repo.create(title=title)
+
+    async def get_conversation(self, conversation_id: int) -> Optional[Conversation]:
         """Get a conversation by ID"""
-        return self.conversation_repo.get(conversation_id)
-    
-    def get_conversations(self, skip: int = 0, limit: int = 50) -> List[Conversation]:
+        return await self.conversation_repo.get(conversation_id)
+
+    async def get_conversations(self, skip: int = 0, limit: int = 50) -> List[Conversation]:
         """Get all conversations ordered by most recent"""
-        return (self.db.query(Conversation)
-                .order_by(desc(Conversation.updated_at))
-                .offset(skip)
-                .limit(limit)
-                .all())
-    
-    def update_conversation_title(self, conversation_id: int, title: str) -> Optional[Conversation]:
+        result = await self.db.execute(lambda_stmt(lambda: select(Conversation)
+                                                   .order_by(desc(Conversation.updated_at))
+                                                   .offset(skip)
+                                                   .limit(limit)))
+        return result.scalars().all()
+
+    async def update_conversation_title(self, conversation_id: int, title: str) -> Optional[Conversation]:
         """Update conversation title"""
-        return self.conversation_repo.update(conversation_id, title=title)
-    
-    def delete_conversation(self, conversation_id: int) -> bool:
+        return await self.conversation_repo.update(conversation_id, title=title)
+
+    async def delete_conversation(self, conversation_id: int) -> bool:
         """Delete a conversation and all its messages"""
-        return self.conversation_repo.delete(conversation_id)
-    
+        # Attached file records are removed by the cascade
+        clear_file_cache()
+        return await self.conversation_repo.delete(conversation_id)
+
+    async def delete_all(self) -> int:
+        """Delete every conversation with its messages and attached file records in bulk"""
+        await self.db.execute(delete(Message))
+        await self.db.execute(delete(File).where(File.conversation_id.isnot(None)))
+        result = await self.db.execute(delete(Conversation))
+        await self.db.commit()
+        clear_file_cache()
+        return result.rowcount
+
     # Message operations
-    def add_message(self, conversation_id: int, role: str, content: str) -> Message:
-        """Add a message to a conversation"""
-        message = self.message_repo.create(
-            conversation_id=conversation_id,
-            role=role,
-            content=content
-        )
-        
-        self.conversation_repo.update(conversation_id, updated_at=message.timestamp)
-        
-        return message
-    
-    def get_conversation_messages(self, conversation_id: int) -> List[Message]:
+    async def add_message(self, conversation_id: int, role: str, content: str,
+                          snapshot: Optional[ConversationSnapshot] = None) -> int:
+        """Add a message to a conversation and return its id"""
+        return await self._insert_message(conversation_id, role, content, snapshot=snapshot)
+
+    async def add_messages(self, conversation_id: int, pairs: List[Tuple[str, str]]) -> int:
+        """Add many (role, content) messages to a conversation in one transaction"""
+        # Explicit, increasing timestamps; server_default now() would give every row the same one
+        start = datetime.now(timezone.utc)
+        rows = [
+            {"conversation_id": conversation_id, "role": role, "content": content,
+             "timestamp": start + timedelta(microseconds=offset)}
+            for offset, (role, content) in enumerate(pairs)
+        ]
+        if not rows:
+            return 0
+
+        await self.message_repo.create_many(rows, commit=False)
+        await self.db.execute(update(Conversation)
+                              .where(Conversation.id == conversation_id)
+                              .values(updated_at=rows[-1]["timestamp"],
+                                      message_count=Conversation.message_count + len(rows)))
+        await self.db.commit()
+        return len(rows)
+
+    async def finalize_turn(self, conversation_id: int, assistant_text: str,
+                            new_title: Optional[str] = None,
+                            snapshot: Optional[ConversationSnapshot] = None) -> int:
+        """Store the assistant reply and update the conversation in one transaction"""
+        return await self._insert_message(conversation_id, "assistant", assistant_text, new_title, snapshot)
+
+    async def _insert_message(self, conversation_id: int, role: str, content: str,
+                              new_title: Optional[str] = None,
+                              snapshot: Optional[ConversationSnapshot] = None) -> int:
+        """Insert a message and bump its conversation's counters with a single commit"""
+        result = await self.db.execute(insert(Message)
+                                       .values(conversation_id=conversation_id, role=role, content=content)
+                                       .returning(Message.id, Message.timestamp))
+        message_id, timestamp = result.one()
+
+        values = {"updated_at": timestamp, "message_count": Conversation.message_count + 1}
+        if new_title:
+            values["title"] = new_title
+
+        result = await self.db.execute(update(Conversation)
+                                       .where(Conversation.id == conversation_id)
+                                       .values(**values)
+                                       .returning(Conversation.title, Conversation.message_count))
+        row = result.one_or_none()
+        await self.db.commit()
+
+        # Refresh the caller's snapshot from the row just written
+        if snapshot is not None and row is not None:
+            snapshot.title, snapshot.message_count = row
+            snapshot.updated_at = timestamp
+        return message_id
+
+    async def get_conversation_messages(self, conversation_id: int) -> List[Message]:
         """Get all messages for a conversation"""
-        return (self.db.query(Message)
-                .filter(Message.conversation_id == conversation_id)
-                .order_by(Message.timestamp)
-                .all())
-    
-    def get_recent_messages(self, conversation_id: int, limit: int = 10) -> List[Message]:
+        result = await self.db.execute(lambda_stmt(lambda: select(Message)
+                                                   .filter(Message.conversation_id == conversation_id)
+                                                   .order_by(Message.timestamp)))
+        return result.scalars().all()
+
+    async def get_conversation_history(self, conversation_id: int) -> List[Tuple[str, str]]:
+        """Get (role, content) pairs for a conversation without loading full Message rows"""
+        result = await self.db.execute(select(Message.role, Message.content)
+                                       .filter(Message.conversation_id == conversation_id)
+                                       .order_by(Message.timestamp))
+        return result.all()
+
+    async def get_history_for_llm(self, conversation_id: int,
+                                  exclude_message_id: Optional[int] = None) -> List[Dict[str, str]]:
+        """Get the role/content history sent to the LLM, optionally leaving out the current message"""
+        # Cached lambda statement: built and compiled once, only the parameters change per turn
+        query = lambda_stmt(lambda: select(Message.role, Message.content)
+                            .filter(Message.conversation_id == conversation_id))
+
+        if exclude_message_id is not None:
+            query += lambda s: s.filter(Message.id != exclude_message_id)
+
+        # Ids follow insertion order even when timestamps tie
+        query += lambda s: s.order_by(Message.id)
+        result = await self.db.execute(query)
+        return [dict(row) for row in result.mappings()]
+
+    async def get_recent_messages(self, conversation_id: int, limit: int = 10) -> List[Message]:
         """Get recent messages for a conversation"""
-        return (self.db.query(Message)
-                .filter(Message.conversation_id == conversation_id)
-                .order_by(desc(Message.timestamp))
-                .limit(limit)
-                .all())
-    
-    def clear_conversation_messages(self, conversation_id: int) -> bool:
+        result = await self.db.execute(lambda_stmt(lambda: select(Message)
+                                                   .filter(Message.conversation_id == conversation_id)
+                                                   .order_by(desc(Message.timestamp))
+                                                   .limit(limit)))
+        return result.scalars().all()
+
+    async def clear_conversation_messages(self, conversation_id: int) -> bool:
         """Clear all messages from a conversation"""
-        deleted_count = (self.db.query(Message)
-                        .filter(Message.conversation_id == conversation_id)
-                        .delete())
-        self.db.commit()
-        return deleted_count > 0
-    
-    def get_conversation_with_messages(self, conversation_id: int) -> Optional[Dict[str, Any]]:
+        result = await self.db.execute(delete(Message)
+                                       .where(Message.conversation_id == conversation_id))
+        await self.db.execute(update(Conversation)
+                              .where(Conversation.id == conversation_id)
+                              .values(message_count=0))
+        await self.db.commit()
+        return result.rowcount > 0
+
+    async def get_conversation_with_messages(self, conversation_id: int) -> Optional[Dict[str, Any]]:
         """Get conversation with all its messages"""
-        conversation = self.get_conversation(conversation_id)
+        result = await self.db.execute(select(Conversation)
+                                       .options(selectinload(Conversation.messages))
+                                       .filter(Conversation.id == conversation_id))
+        conversation = result.scalars().first()
         if not conversation:
             return None
-        
-        messages = self.get_conversation_messages(conversation_id)
-        
+
         return {
             "id": conversation.id,
             "title": conversation.title,
-            "created_at": conversation.created_at.isoformat(),
-            "updated_at": conversation.updated_at.isoformat(),
-            "messages": [msg.to_dict() for msg in messages]
+            "created_at": conversation.created_at,
+            "updated_at": conversation.updated_at,
+            "messages": [msg.to_dict() for msg in conversation.messages]
         }
-    
-    def get_or_create_conversation(self, conversation_id: Optional[int] = None) -> Conversation:
-        """Get existing conversation or create a new one"""
+
+    async def get_conversation_with_messages_json(self, conversation_id: int) -> Optional[str]:
+        """Get a conversation with all its messages as a JSON document built by SQLite"""
+        # json() keeps the aggregated messages as JSON rather than an escaped string
+        result = await self.db.execute(text(
+            "SELECT json_object("
+            f"'id', id, 'title', title, 'created_at', {_ISO_TIMESTAMP.format(column='created_at')}, "
+            f"'updated_at', {_ISO_TIMESTAMP.format(column='updated_at')}, "
+            "'messages', json(("
+            "SELECT json_group_array(json_object("
+            f"'id', id, 'role', role, 'content', content, 'timestamp', {_ISO_TIMESTAMP.format(column='timestamp')})) "
+            "FROM (SELECT id, role, content, timestamp FROM messages "
+            "WHERE conversation_id = :conversation_id ORDER BY timestamp, id)"
+            "))) FROM conversations WHERE id = :conversation_id"
+        ), {"conversation_id": conversation_id})
+        return result.scalar()
+
+    async def get_or_create_conversation(self, conversation_id: Optional[int] = None) -> ConversationSnapshot:
+        """Get existing conversation or create a new one, reading only the columns the chat path needs"""
         if conversation_id:
-            conversation = self.get_conversation(conversation_id)
-            if conversation:
-                return conversation
-        
-        return self.create_conversation()
-    
-    def search_conversations(self, search_term: str, limit: int = 20) -> List[Conversation]:
+            result = await self.db.execute(lambda_stmt(lambda: select(Conversation.id, Conversation.title,
+                                                                      Conversation.message_count,
+                                                                      Conversation.updated_at)
+                                                       .filter(Conversation.id == conversation_id)))
+            row = result.one_or_none()
+            if row is not None:
+                return ConversationSnapshot(*row)
+
+        conversation = await self.create_conversation()
+        return ConversationSnapshot(conversation.id, conversation.title,
+                                    conversation.message_count, conversation.updated_at)
+
+    async def search_conversations(self, search_term: str, limit: int = 20) -> List[Conversation]:
         """Search conversations by title or message content"""
-        return (self.db.query(Conversation)
-                .filter(Conversation.title.contains(search_term))
-                .order_by(desc(Conversation.updated_at))
-                .limit(limit)
-                .all()) 
\ No newline at end of file
+        match_query = self._build_match_query(search_term)
+        if FTS5_AVAILABLE and match_query:
+            result = await self.db.execute(
+                select(Conversation).from_statement(text(
+                    "SELECT conversations.* FROM conversations WHERE id IN ("
+                    "SELECT rowid FROM conversations_fts WHERE conversations_fts MATCH :query "
+                    "UNION SELECT messages.conversation_id FROM messages_fts "
+                    "JOIN messages ON messages.id = messages_fts.rowid WHERE messages_fts MATCH :query) "
+                    "ORDER BY updated_at DESC LIMIT :limit"
+                )),
+                {"query": match_query, "limit": limit}
+            )
+            return result.scalars().all()
+
+        result = await self.db.execute(select(Conversation)
+                                       .filter(Conversation.title.contains(search_term))
+                                       .order_by(desc(Conversation.updated_at))
+                                       .limit(limit))
+        return result.scalars().all()
+
+    @staticmethod
+    def _build_match_query(search_term: str) -> str:
+        """Quote each word as an FTS5 prefix term so user input cannot inject query syntax"""
+        return " ".join('"' + word.replace('"', '""') + '"*' for word in search_term.split())
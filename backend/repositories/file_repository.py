@@ -1,18 +1,29 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
+from typing import List, Optional, Dict
+from cachetools import TTLCache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, and_, select, func, lambda_stmt
 from .base import BaseRepository
-from ..database.models import File, Conversation
+from ..database.models import File, Conversation, CONTENT_HASH_ALGORITHM
+
+# Detached File rows by id; uploads are immutable, the TTL bounds staleness across worker processes
+_file_cache = TTLCache(maxsize=2048, ttl=300)
+
+def clear_file_cache(file_id: Optional[int] = None) -> None:
+    """Invalidate one cached file record, or all of them"""
+    if file_id is None:
+        _file_cache.clear()
+    else:
+        _file_cache.pop(file_id, None)
 
 class FileRepository:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.file_repo = BaseRepository(File, db)
-    
-    def create_file(self, filename: str, file_path: str, file_size: int, 
+
+    async def create_file(self, filename: str, file_path: str, file_size: int,
                    mime_type: str, file_hash: str, conversation_id: Optional[int] = None) -> File:
         """Create a new file record"""
-        return self.file_repo.create(
+        return await self.file_repo.create(
             filename=filename,
             file_path=file_path,
             file_size=file_size,
@@ -20,94 +31,133 @@ class FileRepository:
             file_hash=file_hash,
             conversation_id=conversation_id
         )
-    
-    def get_file(self, file_id: int) -> Optional[File]:
+
+    async def get_file(self, file_id: int) -> Optional[File]:
         """Get a file by ID"""
-        return self.file_repo.get(file_id)
-    
-    def get_file_by_hash(self, file_hash: str) -> Optional[File]:
+        file = _file_cache.get(file_id)
+        if file is not None:
+            return file
+
+        file = await self.file_repo.get(file_id)
+        if file is not None:
+            self.db.expunge(file)
+            _file_cache[file_id] = file
+        return file
+
+    async def get_file_by_hash(self, file_hash: str) -> Optional[File]:
         """Get file by hash (for duplicate detection)"""
-        return self.db.query(File).filter(File.file_hash == file_hash).first()
-    
-    def get_files_by_conversation(self, conversation_id: int, skip: int = 0, limit: int = 50) -> List[File]:
+        result = await self.db.execute(select(File).filter(File.file_hash == file_hash,
+                                                           File.hash_algorithm == CONTENT_HASH_ALGORITHM))
+        return result.scalars().first()
+
+    async def count_files_by_path(self, file_path: str) -> int:
+        """Count file records sharing a stored file (content-addressed uploads)"""
+        result = await self.db.execute(select(func.count(File.id))
+                                       .filter(File.file_path == file_path))
+        return result.scalar_one()
+
+    async def get_stored_path_by_hash(self, file_hash: str) -> Optional[str]:
+        """Get the storage path of already uploaded content with this hash"""
+        result = await self.db.execute(select(File.file_path)
+                                       .filter(File.file_hash == file_hash,
+                                               File.hash_algorithm == CONTENT_HASH_ALGORITHM)
+                                       .limit(1))
+        return result.scalar()
+
+    async def get_files_by_conversation(self, conversation_id: int, skip: int = 0, limit: int = 50) -> List[File]:
         """Get all files for a specific conversation"""
-        return (self.db.query(File)
-                .filter(File.conversation_id == conversation_id)
-                .order_by(desc(File.uploaded_at))
-                .offset(skip)
-                .limit(limit)
-                .all())
-    
-    def get_files_by_mime_type(self, mime_type: str, skip: int = 0, limit: int = 50) -> List[File]:
+        result = await self.db.execute(lambda_stmt(lambda: select(File)
+                                                   .filter(File.conversation_id == conversation_id)
+                                                   .order_by(desc(File.uploaded_at))
+                                                   .offset(skip)
+                                                   .limit(limit)))
+        return result.scalars().all()
+
+    async def get_files_by_mime_type(self, mime_type: str, skip: int = 0, limit: int = 50) -> List[File]:
         """Get files filtered by mime type"""
-        return (self.db.query(File)
-                .filter(File.mime_type == mime_type)
-                .order_by(desc(File.uploaded_at))
-                .offset(skip)
-                .limit(limit)
-                .all())
-    
-    def get_all_files(self, skip: int = 0, limit: int = 50) -> List[File]:
+        result = await self.db.execute(select(File)
+                                       .filter(File.mime_type == mime_type)
+                                       .order_by(desc(File.uploaded_at))
+                                       .offset(skip)
+                                       .limit(limit))
+        return result.scalars().all()
+
+    async def get_all_files(self, skip: int = 0, limit: int = 50) -> List[File]:
         """Get all files ordered by upload date"""
-        return (self.db.query(File)
-                .order_by(desc(File.uploaded_at))
-                .offset(skip)
-                .limit(limit)
-                .all())
-    
-    def search_files(self, search_term: str, conversation_id: Optional[int] = None, 
+        result = await self.db.execute(select(File)
+                                       .order_by(desc(File.uploaded_at))
+                                       .offset(skip)
+                                       .limit(limit))
+        return result.scalars().all()
+
+    async def search_files(self, search_term: str, conversation_id: Optional[int] = None,
                     limit: int = 20) -> List[File]:
         """Search files by filename"""
-        query = self.db.query(File).filter(File.filename.contains(search_term))
-        
+        query = select(File).filter(File.filename.contains(search_term))
+
         if conversation_id:
             query = query.filter(File.conversation_id == conversation_id)
-        
-        return (query.order_by(desc(File.uploaded_at))
-                .limit(limit)
-                .all())
-    
-    def update_file_conversation(self, file_id: int, conversation_id: Optional[int]) -> Optional[File]:
+
+        result = await self.db.execute(query.order_by(desc(File.uploaded_at))
+                                       .limit(limit))
+        return result.scalars().all()
+
+    async def update_file_conversation(self, file_id: int, conversation_id: Optional[int]) -> Optional[File]:
         """Update file's conversation association"""
-        return self.file_repo.update(file_id, conversation_id=conversation_id)
-    
-    def delete_file(self, file_id: int) -> bool:
+        clear_file_cache(file_id)
+        return await self.file_repo.update(file_id, conversation_id=conversation_id)
+
+    async def delete_file(self, file_id: int) -> bool:
         """Delete a file record"""
-        return self.file_repo.delete(file_id)
-    
-    def get_conversation_file_count(self, conversation_id: int) -> int:
+        clear_file_cache(file_id)
+        return await self.file_repo.delete(file_id)
+
+    async def get_conversation_file_count(self, conversation_id: int) -> int:
         """Get count of files in a conversation"""
-        return self.db.query(File).filter(File.conversation_id == conversation_id).count()
-    
-    def get_total_file_size_by_conversation(self, conversation_id: int) -> int:
+        result = await self.db.execute(select(func.count(File.id))
+                                       .filter(File.conversation_id == conversation_id))
+        return result.scalar_one()
+
+    async def get_file_counts(self, conversation_ids: List[int]) -> Dict[int, int]:
+        """Get file counts for many conversations in one grouped query"""
+        if not conversation_ids:
+            return {}
+        result = await self.db.execute(select(File.conversation_id, func.count(File.id))
+                                       .filter(File.conversation_id.in_(conversation_ids))
+                                       .group_by(File.conversation_id))
+        counts = dict.fromkeys(conversation_ids, 0)
+        counts.update(result.all())
+        return counts
+
+    async def get_total_file_size_by_conversation(self, conversation_id: int) -> int:
         """Get total file size for a conversation"""
-        result = (self.db.query(self.db.func.sum(File.file_size))
-                 .filter(File.conversation_id == conversation_id)
-                 .scalar())
-        return result or 0
-    
-    def get_files_by_size_range(self, min_size: int, max_size: int, 
+        result = await self.db.execute(select(func.sum(File.file_size))
+                                       .filter(File.conversation_id == conversation_id))
+        return result.scalar() or 0
+
+    async def get_files_by_size_range(self, min_size: int, max_size: int,
                                skip: int = 0, limit: int = 50) -> List[File]:
         """Get files within size range"""
-        return (self.db.query(File)
-                .filter(and_(File.file_size >= min_size, File.file_size <= max_size))
-                .order_by(desc(File.uploaded_at))
-                .offset(skip)
-                .limit(limit)
-                .all())
-    
-    def get_recent_files(self, limit: int = 10) -> List[File]:
+        result = await self.db.execute(select(File)
+                                       .filter(and_(File.file_size >= min_size, File.file_size <= max_size))
+                                       .order_by(desc(File.uploaded_at))
+                                       .offset(skip)
+                                       .limit(limit))
+        return result.scalars().all()
+
+    async def get_recent_files(self, limit: int = 10) -> List[File]:
         """Get most recently uploaded files"""
-        return (self.db.query(File)
-                .order_by(desc(File.uploaded_at))
-                .limit(limit)
-                .all())
-    
-    def check_duplicate_exists(self, file_hash: str, conversation_id: Optional[int] = None) -> bool:
+        result = await self.db.execute(select(File)
+                                       .order_by(desc(File.uploaded_at))
+                                       .limit(limit))
+        return result.scalars().all()
+
+    async def check_duplicate_exists(self, file_hash: str, conversation_id: Optional[int] = None) -> bool:
         """Check if a duplicate file exists (optionally within conversation)"""
-        query = self.db.query(File).filter(File.file_hash == file_hash)
-        
+        query = select(File).filter(File.file_hash == file_hash, File.hash_algorithm == CONTENT_HASH_ALGORITHM)
+
         if conversation_id:
             query = query.filter(File.conversation_id == conversation_id)
-        
-        return query.first() is not None 
\ No newline at end of file
+
+        result = await self.db.execute(query)
+        return result.scalars().first() is not None
@@ -1,3 +1,3 @@
-from .llm_service import LLMModel
+from .llm_service import LLMModel, ModelRegistry
 
-__all__ = ["LLMModel"] 
\ No newline at end of file
+__all__ = ["LLMModel", "ModelRegistry"]
\ No newline at end of file
@@ -1,11 +1,20 @@
 import os
-import hashlib
-import mimetypes
-import aiofiles
+import time
+import errno
+import uuid
+import asyncio
 from pathlib import Path
-from datetime import datetime
+from urllib.parse import quote
 from typing import Tuple, Optional, List
 from fastapi import UploadFile, HTTPException
+from blake3 import blake3
+from .uring_file import open_file
+
+
+def new_content_hasher() -> blake3:
+    """Hasher for upload content digests (CONTENT_HASH_ALGORITHM: BLAKE3, SIMD and multithreaded)"""
+    return blake3(max_threads=blake3.AUTO)
+
 
 class FileService:
     """Service for handling file upload, storage and management"""
@@ -23,23 +32,37 @@ class FileService:
         'application/xml': ['.xml'],
         'text/xml': ['.xml']
     }
+    SUPPORTED_TYPES = tuple(SUPPORTED_MIME_TYPES)
+    
+    # Extension lookup for supported types (same results as mimetypes.guess_type)
+    EXTENSION_MIME_TYPES = {
+        '.pdf': 'application/pdf',
+        '.txt': 'text/plain',
+        '.md': 'text/markdown',
+        '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        '.doc': 'application/msword',
+        '.html': 'text/html',
+        '.rtf': 'application/rtf',
+        '.csv': 'text/csv',
+        '.json': 'application/json',
+        '.xml': 'application/xml'
+    }
     
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit
+    CHUNK_SIZE = 1024 * 1024  # 1MB read/hash/write blocks
+    DIRECT_IO_MIN_SIZE = 1024 * 1024  # larger uploads bypass the page cache (O_DIRECT)
     UPLOAD_DIR = Path("uploads/files")
     
     def __init__(self):
         self._ensure_upload_directory()
+        # (year, month) and its directory, created once per month instead of on every upload
+        self._storage_month: Optional[Tuple[int, int]] = None
+        self._storage_dir: Optional[Path] = None
     
     def _ensure_upload_directory(self):
         """Create upload directory structure if it doesn't exist"""
         self.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     
-    async def calculate_file_hash(self, file_content: bytes) -> str:
-        """Calculate SHA256 hash of file content for integrity and duplicate detection"""
-        hash_sha256 = hashlib.sha256()
-        hash_sha256.update(file_content)
-        return hash_sha256.hexdigest()
-    
     def validate_file(self, file: UploadFile) -> Tuple[bool, str]:
         """Validate file type and size"""
         
@@ -49,15 +72,11 @@ class FileService:
         
         # Get file extension and mime type
         file_extension = Path(file.filename).suffix.lower()
-        detected_mime_type, _ = mimetypes.guess_type(file.filename)
-        
-        # Use content type from upload if mime detection fails
-        mime_type = detected_mime_type or file.content_type
+        mime_type = self.detect_mime_type(file.filename, file.content_type)
         
         # Check if mime type is supported
         if mime_type not in self.SUPPORTED_MIME_TYPES:
-            supported_types = list(self.SUPPORTED_MIME_TYPES.keys())
-            return False, f"File type '{mime_type}' not supported. Supported types: {supported_types}"
+            return False, f"File type '{mime_type}' not supported. Supported types: {list(self.SUPPORTED_TYPES)}"
         
         # Verify extension matches mime type
         expected_extensions = self.SUPPORTED_MIME_TYPES[mime_type]
@@ -66,47 +85,84 @@ class FileService:
         
         return True, "File validation successful"
     
+    def detect_mime_type(self, filename: str, fallback: Optional[str] = None) -> Optional[str]:
+        """Detect MIME type from the file extension, using the upload's content type if unknown"""
+        return self.EXTENSION_MIME_TYPES.get(Path(filename).suffix.lower()) or fallback
+    
     def generate_storage_path(self, filename: str, file_hash: str) -> Path:
         """Generate organized storage path based on date and hash"""
-        now = datetime.now()
-        year = now.strftime("%Y")
-        month = now.strftime("%m")
+        now = time.localtime()
+        month = (now.tm_year, now.tm_mon)
         
-        # Create subdirectory structure
-        storage_dir = self.UPLOAD_DIR / year / month
-        storage_dir.mkdir(parents=True, exist_ok=True)
+        if month != self._storage_month or self._storage_dir is None:
+            # Create subdirectory structure
+            storage_dir = self.UPLOAD_DIR / f"{now.tm_year:04d}" / f"{now.tm_mon:02d}"
+            storage_dir.mkdir(parents=True, exist_ok=True)
+            self._storage_month, self._storage_dir = month, storage_dir
         
         # Use hash prefix + original filename for uniqueness
-        file_extension = Path(filename).suffix
         safe_filename = f"{file_hash[:8]}_{filename}"
         
-        return storage_dir / safe_filename
+        return self._storage_dir / safe_filename
     
     async def save_file(self, file: UploadFile) -> Tuple[str, str, int]:
-        """Save uploaded file and return (file_path, file_hash, file_size)"""
-        
-        # Read file content
-        content = await file.read()
-        file_size = len(content)
-        
-        # Validate file size after reading
-        if file_size > self.MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413, 
-                detail=f"File size ({file_size / 1024 / 1024:.1f}MB) exceeds maximum allowed size ({self.MAX_FILE_SIZE / 1024 / 1024}MB)"
-            )
-        
-        # Calculate file hash
-        file_hash = await self.calculate_file_hash(content)
-        
-        # Generate storage path
-        storage_path = self.generate_storage_path(file.filename, file_hash)
+        """Stream uploaded file to storage while hashing it and return (file_path, file_hash, file_size)"""
+        temp_path, file_hash, file_size = await self.stream_to_temp(file)
+        return self.store_temp_file(temp_path, file.filename, file_hash), file_hash, file_size
+    
+    async def stream_to_temp(self, file: UploadFile) -> Tuple[Path, str, int]:
+        """Stream uploaded file to a temporary file while hashing it and return (temp_path, file_hash, file_size)"""
+        hasher = new_content_hasher()
+        file_size = 0
         
-        # Save file asynchronously
-        async with aiofiles.open(storage_path, 'wb') as f:
-            await f.write(content)
+        # Hash is only known at the end, so write to a temporary file first
+        temp_path = self.UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
+        direct = bool(file.size) and file.size >= self.DIRECT_IO_MIN_SIZE
         
-        return str(storage_path), file_hash, file_size
+        try:
+            async with open_file(temp_path, 'wb', direct=direct) as f:
+                while chunk := await file.read(self.CHUNK_SIZE):
+                    file_size += len(chunk)
+                    
+                    # Validate file size while streaming
+                    if file_size > self.MAX_FILE_SIZE:
+                        raise HTTPException(
+                            status_code=413, 
+                            detail=f"File size exceeds maximum allowed size ({self.MAX_FILE_SIZE / 1024 / 1024}MB)"
+                        )
+                    
+                    # Single pass: hash the chunk on a worker thread (GIL released) while its write is in flight
+                    await asyncio.gather(asyncio.to_thread(hasher.update, chunk), f.write(chunk))
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        
+        return temp_path, hasher.hexdigest(), file_size
+    
+    def store_temp_file(self, temp_path: Path, filename: str, file_hash: str) -> str:
+        """Move a hashed temporary file to its hash based storage path"""
+        try:
+            storage_path = self.generate_storage_path(filename, file_hash)
+            try:
+                os.replace(temp_path, storage_path)
+            except FileNotFoundError:
+                # Cached month directory was removed (e.g. by another worker's delete cleanup)
+                storage_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_path, storage_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        
+        return str(storage_path)
+    
+    def discard_temp_file(self, temp_path: Path) -> None:
+        """Remove a temporary upload whose content is already stored"""
+        temp_path.unlink(missing_ok=True)
+    
+    def get_internal_redirect_path(self, file_path: str, prefix: str) -> str:
+        """Build the internal nginx location for a stored file (X-Accel-Redirect)"""
+        relative_path = Path(file_path).resolve().relative_to(self.UPLOAD_DIR.resolve())
+        return prefix.rstrip("/") + "/" + quote(relative_path.as_posix())
     
     async def read_file(self, file_path: str) -> bytes:
         """Read file content from storage"""
@@ -115,7 +171,7 @@ class FileService:
         if not path.exists():
             raise HTTPException(status_code=404, detail="File not found")
         
-        async with aiofiles.open(path, 'rb') as f:
+        async with open_file(path, 'rb') as f:
             return await f.read()
     
     async def delete_file(self, file_path: str) -> bool:
@@ -129,19 +185,28 @@ class FileService:
             path.unlink()  
             
             parent = path.parent
-            if parent.exists() and not any(parent.iterdir()):
-                parent.rmdir()
-                grandparent = parent.parent
-                if grandparent.exists() and not any(grandparent.iterdir()):
-                    grandparent.rmdir()
+            if self._remove_empty_dir(parent):
+                if parent == self._storage_dir:
+                    self._storage_dir = None
+                self._remove_empty_dir(parent.parent)
             
             return True
         except Exception:
             return False
     
-    def get_supported_types(self) -> List[str]:
-        """Return list of supported file types"""
-        return list(self.SUPPORTED_MIME_TYPES.keys())
+    def _remove_empty_dir(self, directory: Path) -> bool:
+        """Remove a directory if it is empty; rmdir itself does the emptiness check"""
+        try:
+            os.rmdir(directory)
+            return True
+        except OSError as e:
+            if e.errno in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOENT):
+                return False
+            raise
+    
+    def get_supported_types(self) -> Tuple[str, ...]:
+        """Return supported file types"""
+        return self.SUPPORTED_TYPES
     
     def format_file_size(self, size_bytes: int) -> str:
         """Format file size in human readable format"""
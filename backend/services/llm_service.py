@@ -3,12 +3,21 @@ from langchain.callbacks.manager import CallbackManager
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain.chains import LLMChain
+from ollama import Client
+import httpx
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
 import os
+import logging
+import threading
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
 
 # Default model configuration
-DEFAULT_MODEL = "llama3"
-DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MODEL = settings.DEFAULT_MODEL
+DEFAULT_TEMPERATURE = settings.DEFAULT_TEMPERATURE
 DEFAULT_SYSTEM_PROMPT = """You are CatBot – a clever, curious, and charming AI assistant with the playful spirit of a cat and the smarts of a top-tier business consultant. 
 
 CatBot is a helpful, friendly, and highly knowledgeable virtual assistant designed to support users in a wide range of professional tasks, with a particular flair for:
@@ -54,96 +63,253 @@ Now go forth, CatBot, and make things paw-sitively productive!
 
 """
 
+ERROR_RESPONSE_PREFIX = "Hata oluştu:"
+UNAVAILABLE_RESPONSE = "Ollama servisi çalışmıyor. Lütfen Ollama'yı başlatın veya yükleyin. Daha fazla bilgi için: https://ollama.com/download"
+
+# Models offered to clients, with the configured default always listed first
+_KNOWN_MODELS = ("llama3", "llama3:8b", "llama3:70b", "mistral", "phi3")
+AVAILABLE_MODELS = _KNOWN_MODELS if DEFAULT_MODEL in _KNOWN_MODELS else (DEFAULT_MODEL,) + _KNOWN_MODELS
+
+# Maximum number of conversations whose Ollama context is kept in memory
+MAX_CACHED_SESSIONS = 64
+
+# One keep-alive connection pool to Ollama shared by every model instance
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+def get_ollama_client():
+    """Get the process-wide Ollama client, creating it on first use"""
+    global _shared_client
+    
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = Client(
+                host=settings.OLLAMA_BASE_URL,
+                timeout=httpx.Timeout(settings.OLLAMA_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+            )
+        return _shared_client
+
+
+def format_chat_history(history):
+    """Render role/content messages as prompt lines"""
+    return "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in history)
+
+
+@dataclass
+class SessionState:
+    """Ollama context tokens of a conversation and the number of messages they cover"""
+    context: List[int]
+    message_count: int
+    context_key: Optional[str] = None  # retrieved document chunk set already in the context
+
+
 class LLMModel:
     def __init__(self, model_name=DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE, 
                  system_prompt=DEFAULT_SYSTEM_PROMPT):
         self.model_name = model_name
         self.temperature = temperature
         self.system_prompt = system_prompt
-        self.history = []
+        self.sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
         self.setup_model()
     
     def setup_model(self):
         """Initialize the LLM model with Ollama"""
         try:
+            self.client = get_ollama_client()
+            
             self.llm = Ollama(
                 model=self.model_name,
                 temperature=self.temperature,
                 system=self.system_prompt
             )
             
-            # Create prompt template for chat
-            template = """
-            {system_prompt}
-            
-            Chat History:
-            {chat_history}
-            
-            Human: {human_input}
-            Assistant:
-            """
+            # Create prompt template for chat; the system prompt is sent separately via `system`
+            template = "Chat History:\n{chat_history}\n\nHuman: {human_input}\nAssistant:"
             
             self.prompt = PromptTemplate(
-                input_variables=["system_prompt", "chat_history", "human_input"],
+                input_variables=["chat_history", "human_input"],
                 template=template
             )
             
-            # Create LLM chain
-            self.chain = LLMChain(
-                llm=self.llm,
-                prompt=self.prompt,
-                output_parser=StrOutputParser()
-            )
+            # Create LLM chain; the output parser makes invoke return a plain string
+            self.chain = self.prompt | self.llm | StrOutputParser()
             self.is_available = True
         except Exception as e:
-            print(f"Ollama bağlantı hatası: {e}")
+            logger.error("Ollama bağlantı hatası: %s", e)
             self.is_available = False
     
-    def get_response(self, human_input):
-        """Get response from the model"""
+    def get_response(self, human_input, history=None):
+        """Get response from the model for a message and its conversation history"""
         if not self.is_available:
-            print("Ollama service is not available")
-            return "Ollama servisi çalışmıyor. Lütfen Ollama'yı başlatın veya yükleyin. Daha fazla bilgi için: https://ollama.com/download"
+            logger.warning("Ollama service is not available")
+            return UNAVAILABLE_RESPONSE
             
+        history = history or []
+        
         try:
-            print(f"Getting response for: {human_input}")
-            chat_history = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" 
-                                     for msg in self.history])
+            logger.debug("Getting response for: %s", human_input)
+            chat_history = format_chat_history(history)
             
-            print(f"Chat history length: {len(self.history)} messages")
+            logger.debug("Chat history length: %d messages", len(history))
             
             # Get response
-            print("Invoking LLM chain...")
+            logger.debug("Invoking LLM chain...")
             response = self.chain.invoke({
-                "system_prompt": self.system_prompt,
                 "chat_history": chat_history,
                 "human_input": human_input
             })
             
-            print("Response received from LLM")
-            
-            # Extract text from response if it's a dictionary
-            if isinstance(response, dict) and 'text' in response:
-                response = response['text']
-            
-            # Update history
-            self.history.append({"role": "user", "content": human_input})
-            self.history.append({"role": "assistant", "content": response})
+            logger.debug("Response received from LLM")
             
             return response
         except Exception as e:
-            error_msg = f"Hata oluştu: {str(e)}"
-            print(f"Error in get_response: {error_msg}")
+            error_msg = f"{ERROR_RESPONSE_PREFIX} {str(e)}"
+            logger.error("Error in get_response: %s", error_msg)
             return error_msg
     
-    def clear_history(self):
-        self.history = []
-    
-    def get_available_models(self):
+    def continue_response(self, conversation_id, human_input, history, context_key=None, followup_input=None):
+        """Get response reusing the conversation's cached Ollama context so only the new turn is prefilled"""
         if not self.is_available:
-            return ["llama3"]
+            logger.warning("Ollama service is not available")
+            return UNAVAILABLE_RESPONSE
+        
+        try:
+            prompt, context = self._session_prompt(conversation_id, human_input, history,
+                                                   context_key, followup_input)
+            
+            logger.debug("Continuing conversation %s (cached context: %s)", conversation_id, context is not None)
+            result = self.client.generate(
+                model=self.model_name,
+                prompt=prompt,
+                system=self.system_prompt,
+                context=context,
+                options={"temperature": self.temperature}
+            )
+            
+            self._store_session(conversation_id, result['context'], len(history) + 2, context_key)
             
+            return result['response']
+        except Exception as e:
+            self.drop_session(conversation_id)
+            error_msg = f"{ERROR_RESPONSE_PREFIX} {str(e)}"
+            logger.error("Error in continue_response: %s", error_msg)
+            return error_msg
+    
+    def stream_response(self, conversation_id, human_input, history, context_key=None, followup_input=None):
+        """Yield response tokens as Ollama generates them, reusing the cached conversation context"""
+        if not self.is_available:
+            logger.warning("Ollama service is not available")
+            yield UNAVAILABLE_RESPONSE
+            return
+        
         try:
-            return ["llama3", "llama3:8b", "llama3:70b", "mistral", "phi3"]
-        except:
-            return ["llama3"] 
\ No newline at end of file
+            prompt, context = self._session_prompt(conversation_id, human_input, history,
+                                                   context_key, followup_input)
+            
+            logger.debug("Streaming conversation %s (cached context: %s)", conversation_id, context is not None)
+            for chunk in self.client.generate(
+                model=self.model_name,
+                prompt=prompt,
+                system=self.system_prompt,
+                context=context,
+                options={"temperature": self.temperature},
+                stream=True
+            ):
+                if chunk['response']:
+                    yield chunk['response']
+                
+                if chunk['done']:
+                    self._store_session(conversation_id, chunk['context'], len(history) + 2, context_key)
+        except Exception as e:
+            self.drop_session(conversation_id)
+            error_msg = f"{ERROR_RESPONSE_PREFIX} {str(e)}"
+            logger.error("Error in stream_response: %s", error_msg)
+            yield error_msg
+    
+    def _session_prompt(self, conversation_id, human_input, history, context_key=None, followup_input=None):
+        """Build the prompt and cached context for the next turn of a conversation"""
+        with self._sessions_lock:
+            state = self.sessions.get(conversation_id)
+        
+        if state and state.message_count == len(history):
+            # Same document chunks as an earlier turn: they are already in the context, don't prefill them again
+            if context_key and followup_input and state.context_key == context_key:
+                return followup_input, state.context
+            
+            # Warm session: Ollama re-uses the KV cache for the context prefix
+            return human_input, state.context
+        
+        # Cold or out-of-sync session: prefill the whole history once
+        if not history:
+            return human_input, None
+        
+        chat_history = format_chat_history(history)
+        return f"Chat History:\n{chat_history}\n\nHuman: {human_input}\nAssistant:", None
+    
+    def _store_session(self, conversation_id, context, message_count, context_key=None):
+        """Remember a conversation's context, evicting the least recently used sessions"""
+        with self._sessions_lock:
+            if context_key is None and conversation_id in self.sessions:
+                # Retrieved documents stay in the context after turns without retrieval
+                context_key = self.sessions[conversation_id].context_key
+            self.sessions[conversation_id] = SessionState(context=context, message_count=message_count,
+                                                          context_key=context_key)
+            self.sessions.move_to_end(conversation_id)
+            while len(self.sessions) > MAX_CACHED_SESSIONS:
+                self.sessions.popitem(last=False)
+    
+    def drop_session(self, conversation_id):
+        """Forget the cached context of a conversation"""
+        with self._sessions_lock:
+            self.sessions.pop(conversation_id, None)
+    
+    def is_error_response(self, response):
+        """Check whether a response is an error message rather than model output"""
+        return response == UNAVAILABLE_RESPONSE or response.startswith(ERROR_RESPONSE_PREFIX)
+    
+    def get_available_models(self):
+        """Get the selectable model names (only the default while Ollama is unreachable)"""
+        return AVAILABLE_MODELS if self.is_available else (DEFAULT_MODEL,)
+
+
+class ModelRegistry:
+    """Keeps recently used LLM models loaded and dispatches requests by model name"""
+    
+    def __init__(self, max_loaded=None):
+        self.max_loaded = max_loaded or settings.MAX_LOADED_MODELS
+        self.models = OrderedDict()
+        
+        # Build the default model up front so the first request doesn't pay for it
+        self.get(DEFAULT_MODEL)
+    
+    def get(self, model_name=None):
+        """Get a loaded model by name, loading it and evicting the least recently used one if needed"""
+        model_name = model_name or DEFAULT_MODEL
+        
+        model = self.models.get(model_name)
+        if model is not None:
+            self.models.move_to_end(model_name)
+            return model
+        
+        model = LLMModel(model_name=model_name)
+        self.models[model_name] = model
+        
+        while len(self.models) > self.max_loaded:
+            evicted_name, evicted = self.models.popitem(last=False)
+            logger.info("Unloading model %s", evicted_name)
+            del evicted
+        
+        return model
+    
+    def drop_session(self, conversation_id):
+        """Forget a conversation's cached context in every loaded model"""
+        for model in self.models.values():
+            model.drop_session(conversation_id)
+    
+    def clear_sessions(self):
+        """Forget all cached conversation contexts"""
+        for model in self.models.values():
+            with model._sessions_lock:
+                model.sessions.clear()
@@ -1,17 +1,148 @@
 import os
+import mmap
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, List, Iterator
+from cachetools import LRUCache
+import numpy as np
 from docx import Document
-try:
-    import fitz  # PyMuPDF
-    PYMUPDF_AVAILABLE = True
-except ImportError:
-    PYMUPDF_AVAILABLE = False
-    print("⚠️ PyMuPDF not available, using PyPDF2 only")
-
-import PyPDF2  # Fallback for PyMuPDF
+from lxml import etree
+import fitz  # PyMuPDF
 from dataclasses import dataclass
 
+from .text_splitter import TextSplitter, TextChunk
+
+
+class PDFHandleCache(LRUCache):
+    """LRU of open PyMuPDF documents that closes handles as they are evicted"""
+    
+    def popitem(self):
+        key, document = super().popitem()
+        document.close()
+        return key, document
+
+
+# PyMuPDF is not thread-safe, so cached handles are only used while holding the lock
+_pdf_handles = PDFHandleCache(maxsize=32)
+_pdf_lock = threading.RLock()
+
+
+def open_pdf(file_path: str):
+    """Open a PDF through the handle cache, keyed by path and modification time.
+
+    Callers must hold pdf_lock() while using the returned document.
+    """
+    path = os.path.normpath(os.path.abspath(file_path))
+    key = (path, os.stat(path).st_mtime)
+    
+    with _pdf_lock:
+        document = _pdf_handles.get(key)
+        if document is None:
+            document = fitz.open(path)
+            _pdf_handles[key] = document
+        return document
+
+
+def pdf_lock() -> threading.RLock:
+    """Lock guarding every use of cached PyMuPDF documents"""
+    return _pdf_lock
+
+
+def close_cached_pdf(file_path: str) -> None:
+    """Close cached handles for a file, e.g. before deleting it from storage"""
+    path = os.path.normpath(os.path.abspath(file_path))
+    
+    with _pdf_lock:
+        for key in [key for key in _pdf_handles if key[0] == path]:
+            _pdf_handles.pop(key).close()
+
+
+# Large PDFs are split into page ranges extracted in parallel worker processes
+PARALLEL_MIN_PAGES = 64
+PAGES_PER_TASK = 32
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def _extract_pages(file_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of a page range (runs in a worker process with its own document handle)"""
+    with fitz.open(file_path) as document:
+        return [document[page_number].get_text("text", sort=False) for page_number in range(start, end)]
+
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    """Get the shared page extraction pool, starting it on first use"""
+    global _page_pool
+    
+    with _page_pool_lock:
+        if _page_pool is None:
+            # spawn: forking a process that already runs threads is unsafe
+            _page_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return _page_pool
+
+
+def extract_pages_parallel(file_path: str, page_count: int) -> List[str]:
+    """Extract all page texts of a PDF by fanning page ranges out to the process pool"""
+    page_texts = []
+    for page_range in iter_page_ranges_parallel(file_path, page_count):
+        page_texts.extend(page_range)
+    return page_texts
+
+
+def iter_page_ranges_parallel(file_path: str, page_count: int) -> Iterator[List[str]]:
+    """Submit every page range to the process pool at once and yield their texts in page order as they finish"""
+    pool = _get_page_pool()
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    futures = [pool.submit(_extract_pages, file_path, start, end) for start, end in ranges]
+    
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        # Abandoned early (e.g. a failed embed): drop the ranges that have not started yet
+        for future in futures:
+            future.cancel()
+
+
+# Body paragraphs and their run content, matched in C instead of python-docx's per-run objects
+W_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_docx_paragraphs = etree.XPath('./w:p', namespaces={'w': W_NAMESPACE})
+_docx_run_content = etree.XPath(
+    './w:r/*[self::w:t or self::w:tab or self::w:ptab or self::w:br or self::w:cr or self::w:noBreakHyphen]'
+    ' | ./w:hyperlink/w:r/*[self::w:t or self::w:tab or self::w:ptab or self::w:br or self::w:cr or self::w:noBreakHyphen]',
+    namespaces={'w': W_NAMESPACE}
+)
+_docx_text_tag = f'{{{W_NAMESPACE}}}t'
+_docx_break_tag = f'{{{W_NAMESPACE}}}br'
+_docx_break_type = f'{{{W_NAMESPACE}}}type'
+_docx_special_text = {
+    f'{{{W_NAMESPACE}}}tab': '\t',
+    f'{{{W_NAMESPACE}}}ptab': '\t',
+    f'{{{W_NAMESPACE}}}cr': '\n',
+    f'{{{W_NAMESPACE}}}noBreakHyphen': '-'
+}
+
+
+def _docx_paragraph_text(paragraph) -> str:
+    """Text of a w:p element, matching python-docx's Paragraph.text"""
+    parts = []
+    for element in _docx_run_content(paragraph):
+        tag = element.tag
+        if tag == _docx_text_tag:
+            parts.append(element.text or '')
+        elif tag == _docx_break_tag:
+            # Only line breaks are text; page and column breaks are not
+            if element.get(_docx_break_type, 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        else:
+            parts.append(_docx_special_text[tag])
+    return ''.join(parts)
+
 
 @dataclass
 class DocumentContent:
@@ -29,8 +160,9 @@ class DocumentProcessor:
         'text/plain': '_process_txt'
     }
     
-    def __init__(self):
-        pass
+    def __init__(self, parallel_pages: bool = True):
+        # Disabled inside worker processes, which must not start a page pool of their own
+        self.parallel_pages = parallel_pages
     
     def process_document(self, file_path: str) -> DocumentContent:
         """Process document and extract text with metadata"""
@@ -70,65 +202,85 @@ class DocumentProcessor:
         return extension_map.get(extension, 'unknown')
     
     def _process_pdf(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
-        """Extract text from PDF files with robust engine testing"""
+        """Extract text from PDF files with PyMuPDF"""
         # Normalize path for Windows
         normalized_path = os.path.normpath(file_path)
-        print(f"📄 Processing PDF: {normalized_path}")
+        logging.getLogger(__name__).debug("Processing PDF: %s", normalized_path)
         
-        # Test file readability first
-        try:
-            with open(normalized_path, 'rb') as test_file:
-                test_file.read(1024)  # Read first 1KB to test
-            print(f"✅ PDF file is readable")
-        except Exception as e:
-            raise ValueError(f"Cannot read PDF file: {str(e)}")
+        with pdf_lock():
+            pdf_document = self._open_pdf_checked(normalized_path)
+            metadata = self._read_pdf_metadata(pdf_document)
+            
+            # Small documents: one C call per page here; reading order sorting is left off
+            page_texts = None
+            if metadata['pages'] < PARALLEL_MIN_PAGES or not self.parallel_pages:
+                page_texts = [page.get_text("text", sort=False) for page in pdf_document]
         
-        # Try PyMuPDF first (more robust)
-        if PYMUPDF_AVAILABLE:
-            print(f"🔍 Trying PyMuPDF (fitz)...")
+        if page_texts is None:
             try:
-                return self._process_pdf_with_pymupdf(normalized_path)
-            except Exception as pymupdf_error:
-                print(f"❌ PyMuPDF failed: {pymupdf_error}")
-        else:
-            print(f"⚠️ PyMuPDF not available, skipping to PyPDF2...")
+                page_texts = extract_pages_parallel(normalized_path, metadata['pages'])
+            except Exception as e:
+                logging.getLogger(__name__).warning("Parallel PDF extraction failed, extracting serially: %s", e)
+                with pdf_lock():
+                    page_texts = [page.get_text("text", sort=False) for page in open_pdf(normalized_path)]
         
-        # Fallback to PyPDF2
-        print(f"🔄 Using PyPDF2...")
-        try:
-            return self._process_pdf_with_pypdf2(normalized_path)
-        except Exception as pypdf2_error:
-            print(f"❌ PyPDF2 also failed: {pypdf2_error}")
-            
-            # Both engines failed - check if it's an image-based PDF
-            error_msg = f"Failed to extract text from PDF:\n"
-            if PYMUPDF_AVAILABLE:
-                error_msg += f"  - PyMuPDF: Failed\n"
-            error_msg += f"  - PyPDF2: {str(pypdf2_error)}\n"
-            error_msg += f"This PDF might be image-based and require OCR processing."
-            
-            raise ValueError(error_msg)
+        text_content = [page_text for page_text in page_texts if page_text and not page_text.isspace()]
+        total_text = '\n\n'.join(text_content)
+        
+        if not total_text.strip():
+            raise ValueError("No readable text found in PDF. The PDF appears to be image-based and requires OCR processing.")
+        
+        return total_text, metadata
     
-    def _process_pdf_with_pymupdf(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
-        """Extract text using PyMuPDF with enhanced error handling"""
-        text_content = []
-        metadata = {'pages': 0, 'processing_engine': 'PyMuPDF'}
+    def stream_pdf(self, file_path: str) -> Tuple[Dict[str, Any], Iterator[str]]:
+        """Open a PDF and return its metadata with a lazy iterator over its non-blank page texts"""
+        normalized_path = os.path.normpath(file_path)
         
-        pdf_document = fitz.open(file_path)
-        metadata['pages'] = len(pdf_document)
+        with pdf_lock():
+            metadata = self._read_pdf_metadata(self._open_pdf_checked(normalized_path))
+        metadata.update(self._extract_base_metadata(normalized_path))
         
-        if metadata['pages'] == 0:
-            pdf_document.close()
-            raise ValueError("PDF has 0 pages")
+        return metadata, self._iter_pdf_pages(normalized_path, metadata['pages'])
+    
+    def _iter_pdf_pages(self, file_path: str, page_count: int) -> Iterator[str]:
+        """Yield page texts one at a time, skipping blank pages"""
+        next_page = 0
+        if page_count >= PARALLEL_MIN_PAGES and self.parallel_pages:
+            # Large documents: worker processes extract page ranges ahead of the consumer
+            try:
+                for page_range in iter_page_ranges_parallel(file_path, page_count):
+                    for page_text in page_range:
+                        next_page += 1
+                        if page_text and not page_text.isspace():
+                            yield page_text
+                return
+            except Exception as e:
+                logging.getLogger(__name__).warning(
+                    "Parallel PDF extraction failed at page %d, extracting serially: %s", next_page, e
+                )
         
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            page_text = page.get_text()
-            
-            if page_text.strip():
-                text_content.append(page_text)
+        for page_number in range(next_page, page_count):
+            # Lock per page so other requests can use the cached handles in between
+            with pdf_lock():
+                page_text = open_pdf(file_path)[page_number].get_text("text", sort=False)
+            if page_text and not page_text.isspace():
+                yield page_text
+    
+    def _open_pdf_checked(self, file_path: str) -> fitz.Document:
+        """Open a PDF through the handle cache, rejecting unreadable and empty files (caller holds pdf_lock)"""
+        try:
+            pdf_document = open_pdf(file_path)
+        except Exception as e:
+            raise ValueError(f"Cannot read PDF file: {str(e)}")
+        
+        if len(pdf_document) == 0:
+            raise ValueError("PDF has 0 pages")
+        return pdf_document
+    
+    def _read_pdf_metadata(self, pdf_document: fitz.Document) -> Dict[str, Any]:
+        """Page count and document info of an open PDF"""
+        metadata = {'pages': len(pdf_document), 'processing_engine': 'PyMuPDF'}
         
-        # Extract PDF metadata
         pdf_metadata = pdf_document.metadata
         if pdf_metadata:
             metadata.update({
@@ -140,64 +292,17 @@ class DocumentProcessor:
                 'creation_date': pdf_metadata.get('creationDate', ''),
                 'modification_date': pdf_metadata.get('modDate', '')
             })
-        
-        pdf_document.close()
-        
-        total_text = '\n\n'.join(text_content)
-        
-        if not total_text.strip():
-            raise ValueError("No readable text found in PDF. The PDF appears to be image-based.")
-        
-        return total_text, metadata
-    
-    def _process_pdf_with_pypdf2(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
-        """Extract text using PyPDF2 with enhanced error handling"""
-        text_content = []
-        metadata = {'pages': 0, 'processing_engine': 'PyPDF2'}
-        
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            metadata['pages'] = len(pdf_reader.pages)
-            
-            if metadata['pages'] == 0:
-                raise ValueError("PDF has 0 pages")
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text.strip():
-                        text_content.append(page_text)
-                except Exception:
-                    pass
-            
-            # Extract PDF metadata
-            if pdf_reader.metadata:
-                pdf_meta = pdf_reader.metadata
-                metadata.update({
-                    'title': pdf_meta.get('/Title', ''),
-                    'author': pdf_meta.get('/Author', ''),
-                    'subject': pdf_meta.get('/Subject', ''),
-                    'creator': pdf_meta.get('/Creator', '')
-                })
-        
-        total_text = '\n\n'.join(text_content)
-        
-        if not total_text.strip():
-            raise ValueError("No readable text found in PDF. The PDF appears to be image-based.")
-        
-        return total_text, metadata
+        return metadata
     
     def _process_docx(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
         """Extract text from DOCX files"""
         doc = Document(file_path)
         
-        text_content = []
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text_content.append(paragraph.text)
+        paragraph_texts = [_docx_paragraph_text(paragraph) for paragraph in _docx_paragraphs(doc.element.body)]
+        text_content = [text for text in paragraph_texts if text.strip()]
         
         metadata = {
-            'paragraphs': len(doc.paragraphs),
+            'paragraphs': len(paragraph_texts),
             'title': doc.core_properties.title or '',
             'author': doc.core_properties.author or '',
             'subject': doc.core_properties.subject or '',
@@ -208,11 +313,24 @@ class DocumentProcessor:
     
     def _process_txt(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
         """Extract text from plain text files"""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return '', {'lines': 0, 'characters': 0}
+            
+            # Decode straight from the mapping and count newlines with a vectorized compare
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                content = str(mapped, 'utf-8')
+                data = np.frombuffer(mapped, dtype=np.uint8)
+                lines = int(np.count_nonzero(data == 0x0A)) + (data[-1] != 0x0A)
+                del data
+        
+        if '\r' in content:
+            # Universal newlines, as text mode reading did
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+            lines = len(content.splitlines())
         
         metadata = {
-            'lines': len(content.splitlines()),
+            'lines': int(lines),
             'characters': len(content)
         }
         
@@ -229,4 +347,11 @@ class DocumentProcessor:
             'created_at': stat.st_ctime,
             'modified_at': stat.st_mtime,
             'file_extension': path_obj.suffix.lower()
-        } 
\ No newline at end of file
+        } 
+
+
+def parse_and_split(file_path: str, chunk_size: int, chunk_overlap: int) -> Tuple[str, List[TextChunk]]:
+    """Extract and split one document into (file_type, chunks); runs in a worker process"""
+    doc_content = DocumentProcessor(parallel_pages=False).process_document(file_path)
+    chunks = TextSplitter(chunk_size, chunk_overlap).split_text(doc_content.text, doc_content.metadata)
+    return doc_content.file_type, chunks
@@ -0,0 +1,175 @@
+import os
+import hashlib
+import sqlite3
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """LRU of text embeddings keyed by a hash of the normalized text"""
+
+    def __init__(self, maxsize: int = 4096, lowercase: bool = False):
+        self.maxsize = maxsize
+        self.lowercase = lowercase
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def build_key(self, text: str, normalize: bool = True) -> str:
+        """Hash text with whitespace collapsed (and lowercased for uncased models)"""
+        normalized_text = " ".join(text.split())
+        if self.lowercase:
+            normalized_text = normalized_text.lower()
+        return hashlib.sha256(f"{int(normalize)}|{normalized_text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Get a cached embedding"""
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        """Cache an embedding, evicting the least recently used one when full"""
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all cached embeddings"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache size and hit rate"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class ChunkEmbeddingStore:
+    """Persistent SQLite store of chunk embeddings keyed by (embedding id, BLAKE2b of the text).
+
+    Lets re-ingested documents skip the model for chunks it has seen before,
+    also across restarts. Vectors are stored as raw float32 bytes. The embedding
+    id names the model and its runtime (EmbeddingService.embedding_id), so ONNX
+    and PyTorch vectors are never mixed.
+    """
+
+    DEFAULT_PATH = "./data/embedding_cache.db"
+
+    def __init__(self, path: str = None, dimension: int = 384):
+        self.path = path or self.DEFAULT_PATH
+        self.dimension = dimension
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def build_key(text: str) -> bytes:
+        """16 byte BLAKE2b digest of the chunk text"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def lookup(self, model_name: str, texts: List[str]) -> Tuple[List[bytes], List[Optional[np.ndarray]]]:
+        """Get (keys, embeddings) for texts; embeddings are None for misses"""
+        keys = [self.build_key(text) for text in texts]
+        found: Dict[bytes, np.ndarray] = {}
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                # Stay under SQLite's bound parameter limit
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    rows = connection.execute(
+                        f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                        [model_name, *batch]
+                    )
+                    for key, vector in rows:
+                        found[key] = np.frombuffer(vector, dtype=np.float32)
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding store lookup failed: {e}")
+
+        embeddings = [found.get(key) for key in keys]
+        hits = sum(embedding is not None for embedding in embeddings)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return keys, embeddings
+
+    def put_many(self, model_name: str, keys: List[bytes], embeddings: np.ndarray) -> None:
+        """Persist embeddings in one transaction (all-zero fallback vectors are skipped)"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        rows = [(model_name, key, embedding.tobytes())
+                for key, embedding in zip(keys, embeddings) if embedding.any()]
+        if not rows:
+            return
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)", rows
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding store write failed: {e}")
+
+    def clear(self) -> None:
+        """Delete all stored embeddings"""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM embeddings")
+
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get store path and hit rate"""
+        total = self.hits + self.misses
+        return {
+            'path': self.path,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use (callers hold the lock)"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, key BLOB NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, key)) WITHOUT ROWID"
+            )
+            self._connection = connection
+        return self._connection
@@ -1,8 +1,66 @@
 import numpy as np
-from typing import List, Union, Optional
+import queue
+import platform
+import threading
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import List, Union, Optional, Tuple, Iterable, Iterator
 from sentence_transformers import SentenceTransformer
 import logging
 
+from .embed_cache import EmbeddingCache
+from ...core.config import settings
+
+try:
+    import onnxruntime  # noqa: F401
+    from optimum.onnxruntime import ORTModelForFeatureExtraction  # noqa: F401
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def _quantized_onnx_file() -> str:
+    """Pick the int8 ONNX export of the model hub repo that matches this CPU"""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+@lru_cache(maxsize=2)
+def load_sentence_transformer(model_name: str, device: str) -> Tuple[SentenceTransformer, str]:
+    """Load an embedding model once per process and return (model, backend)"""
+    if settings.EMBEDDING_BACKEND == "onnx" and ONNX_AVAILABLE and device == "cpu":
+        # int8 quantized ONNX Runtime build, falling back to PyTorch
+        file_name = _quantized_onnx_file()
+        try:
+            model = SentenceTransformer(model_name, device=device, backend="onnx",
+                                        model_kwargs={"file_name": file_name})
+            return model, f"onnx:{file_name}"
+        except Exception as e:
+            logger.warning(f"ONNX embedding model unavailable, using PyTorch: {e}")
+    
+    return SentenceTransformer(model_name, device=device), "torch"
+
+
+# Texts buffered ahead of the encoder, in batches
+STREAM_QUEUE_BATCHES = 4
+
+
+@dataclass
+class _ProducerError:
+    """Exception raised by the iterable feeding encode_stream"""
+    error: BaseException
+
 
 class EmbeddingService:
     """English-optimized embedding generation service"""
@@ -15,6 +73,8 @@ class EmbeddingService:
         self.device = device
         self.model = None
         self._is_loaded = False
+        self.backend = "torch"
+        self.cache = EmbeddingCache()
         
         self.logger = logging.getLogger(__name__)
     
@@ -25,8 +85,13 @@ class EmbeddingService:
         
         try:
             self.logger.info(f"Loading embedding model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name, device=self.device)
+            self.model, self.backend = load_sentence_transformer(self.model_name, self.device)
             self._is_loaded = True
+            
+            # Case only affects the cache key when the tokenizer keeps it
+            tokenizer = getattr(self.model, 'tokenizer', None)
+            self.cache.lowercase = bool(getattr(tokenizer, 'do_lower_case', False))
+            self.cache.clear()
             self.logger.info("Embedding model loaded successfully")
         except Exception as e:
             self.logger.error(f"Failed to load embedding model: {e}")
@@ -37,55 +102,138 @@ class EmbeddingService:
         if not text or not text.strip():
             return [0.0] * self.EMBEDDING_DIMENSION
         
-        embeddings = self.generate_embeddings([text], normalize=normalize)
-        return embeddings[0]
+        key = self.cache.build_key(text, normalize)
+        embedding = self.cache.get(key)
+        if embedding is not None:
+            return embedding
+        
+        self._ensure_model_loaded()
+        try:
+            embedding = self.model.encode(
+                [text.strip()],
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+                show_progress_bar=False
+            )[0].tolist()
+        except Exception as e:
+            # Zero vector fallback of a failed encode is not cached
+            self.logger.error(f"Failed to generate embedding: {e}")
+            return [0.0] * self.EMBEDDING_DIMENSION
+        
+        self.cache.put(key, embedding)
+        return embedding
     
     def generate_embeddings(self, texts: List[str], 
                           normalize: bool = True,
-                          batch_size: int = 32) -> List[List[float]]:
-        """Generate embeddings for multiple texts"""
+                          batch_size: int = 32) -> np.ndarray:
+        """Generate embeddings for multiple texts as an (N, dim) float32 array"""
         if not texts:
-            return []
+            return np.empty((0, self.EMBEDDING_DIMENSION), dtype=np.float32)
         
         self._ensure_model_loaded()
         
         # Filter empty texts
         non_empty_texts = [text.strip() for text in texts if text and text.strip()]
         if not non_empty_texts:
-            return [[0.0] * self.EMBEDDING_DIMENSION] * len(texts)
+            return np.zeros((len(texts), self.EMBEDDING_DIMENSION), dtype=np.float32)
         
         try:
-            # Generate embeddings in batches
-            all_embeddings = []
-            
-            for i in range(0, len(non_empty_texts), batch_size):
-                batch = non_empty_texts[i:i + batch_size]
-                
-                batch_embeddings = self.model.encode(
-                    batch,
-                    convert_to_numpy=True,
-                    normalize_embeddings=normalize,
-                    show_progress_bar=len(non_empty_texts) > 100
-                )
-                
-                all_embeddings.extend(batch_embeddings.tolist())
-            
-            return all_embeddings
+            # encode sorts by length and batches internally, padding each batch minimally
+            embeddings = self.model.encode(
+                non_empty_texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=normalize,
+                show_progress_bar=False
+            )
+            return np.asarray(embeddings, dtype=np.float32)
             
         except Exception as e:
             self.logger.error(f"Failed to generate embeddings: {e}")
             # Return zero vectors as fallback
-            return [[0.0] * self.EMBEDDING_DIMENSION] * len(texts)
+            return np.zeros((len(texts), self.EMBEDDING_DIMENSION), dtype=np.float32)
+    
+    def encode_stream(self, texts: Iterable[str], 
+                      normalize: bool = True,
+                      batch_size: int = 32) -> Iterator[np.ndarray]:
+        """Encode texts from a slow iterable while it is still producing them.
+        
+        The iterable is drained on a producer thread into a bounded queue, and every
+        full batch is encoded as soon as it is available; yields one float32
+        array per batch, in order. Errors raised by the iterable are re-raised here.
+        When the consumer stops early the producer stops and closes the iterable.
+        """
+        self._ensure_model_loaded()
+        
+        pending = queue.Queue(maxsize=STREAM_QUEUE_BATCHES * batch_size)
+        stop = threading.Event()
+        finished = object()
+        
+        def put(item) -> bool:
+            # Block while the queue is full, but give up once the consumer has gone
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce() -> None:
+            source = iter(texts)
+            try:
+                for text in source:
+                    if not put(text):
+                        return
+            except BaseException as e:
+                put(_ProducerError(e))
+            finally:
+                close = getattr(source, "close", None)
+                if close is not None:
+                    close()
+                put(finished)
+        
+        threading.Thread(target=produce, name="embedding-producer", daemon=True).start()
+        
+        try:
+            batch = []
+            while True:
+                item = pending.get()
+                if item is finished:
+                    break
+                if isinstance(item, _ProducerError):
+                    raise item.error
+                
+                batch.append(item)
+                if len(batch) == batch_size:
+                    yield self._encode_batch(batch, normalize)
+                    batch = []
+            
+            if batch:
+                yield self._encode_batch(batch, normalize)
+        finally:
+            stop.set()
+    
+    def _encode_batch(self, texts: List[str], normalize: bool) -> np.ndarray:
+        """Encode one batch as a float32 array"""
+        embeddings = self.model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=normalize,
+            show_progress_bar=False
+        )
+        return np.asarray(embeddings, dtype=np.float32)
     
     def compute_similarity(self, embedding1: List[float], 
                           embedding2: List[float]) -> float:
         """Compute cosine similarity between two embeddings"""
-        if not embedding1 or not embedding2:
+        if not len(embedding1) or not len(embedding2):
             return 0.0
         
         try:
-            vec1 = np.array(embedding1)
-            vec2 = np.array(embedding2)
+            vec1 = np.asarray(embedding1, dtype=np.float32)
+            vec2 = np.asarray(embedding2, dtype=np.float32)
             
             # Handle zero vectors
             norm1 = np.linalg.norm(vec1)
@@ -102,21 +250,40 @@ class EmbeddingService:
             return 0.0
     
     def find_most_similar(self, query_embedding: List[float], 
-                         candidate_embeddings: List[List[float]],
-                         top_k: int = 5) -> List[tuple]:
-        """Find most similar embeddings to query"""
-        if not query_embedding or not candidate_embeddings:
+                         candidate_embeddings: Union[List[List[float]], np.ndarray],
+                         top_k: int = 5,
+                         normalized: bool = False) -> List[tuple]:
+        """Find most similar embeddings to query with one matrix-vector product.
+        
+        Pass normalized=True when both sides are unit length (generate_embeddings
+        output) to skip the norm divisions, and an (N, dim) float32 array to
+        avoid converting the candidates on every call.
+        """
+        if not len(query_embedding) or not len(candidate_embeddings) or top_k <= 0:
             return []
         
-        similarities = []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+        similarities = candidates @ query
+        
+        if not normalized:
+            # Cosine similarity; zero vectors score 0
+            norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(query)
+            similarities = np.divide(similarities, norms, out=np.zeros_like(similarities), where=norms != 0)
         
-        for i, candidate in enumerate(candidate_embeddings):
-            similarity = self.compute_similarity(query_embedding, candidate)
-            similarities.append((i, similarity))
+        if top_k < len(similarities):
+            top = np.argpartition(-similarities, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(similarities))
+        top = top[np.argsort(-similarities[top], kind="stable")]
         
-        # Sort by similarity (descending) and return top_k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:top_k]
+        return list(zip(top.tolist(), similarities[top].tolist()))
+    
+    @property
+    def embedding_id(self) -> str:
+        """Model name qualified by the runtime, whose vectors differ slightly from PyTorch's"""
+        self._ensure_model_loaded()
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
     
     def get_model_info(self) -> dict:
         """Get information about the loaded model"""
@@ -124,7 +291,10 @@ class EmbeddingService:
             'model_name': self.model_name,
             'embedding_dimension': self.EMBEDDING_DIMENSION,
             'device': self.device,
+            'backend': self.backend,
+            'embedding_id': self.embedding_id if self._is_loaded else None,
             'is_loaded': self._is_loaded,
+            'query_cache': self.cache.get_stats(),
             'model_max_length': getattr(self.model, 'max_seq_length', 'unknown') if self.model else 'unknown'
         }
     
@@ -134,9 +304,8 @@ class EmbeddingService:
             self.load_model()
     
     def cleanup(self) -> None:
-        """Clean up model resources"""
+        """Release this service's model (load_sentence_transformer.cache_clear() frees it process-wide)"""
         if self.model is not None:
-            del self.model
             self.model = None
             self._is_loaded = False
-            self.logger.info("Embedding model cleaned up") 
\ No newline at end of file
+            self.logger.info("Embedding model released") 
\ No newline at end of file
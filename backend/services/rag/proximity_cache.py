@@ -0,0 +1,97 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any
+from .vector_store import SearchResult
+
+
+class ProximityCache:
+    """Approximate retrieval cache keyed by query embedding.
+
+    A lookup hits when a cached query embedding lies within `tolerance` cosine
+    distance of the new one, so near-duplicate questions skip the vector search.
+    Embeddings are stored L2-normalized in one preallocated float32 matrix and
+    compared with a single matrix-vector product.
+    """
+
+    def __init__(self, dimension: int, capacity: int = 1024,
+                 tolerance: float = 0.05, ttl: float = 300.0):
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.ttl = ttl
+
+        self._keys = np.zeros((capacity, dimension), dtype=np.float32)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # slot -> (top_k, results), LRU order
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, embedding: List[float], top_k: int) -> Optional[List[SearchResult]]:
+        """Return cached results for a nearby query that retrieved at least top_k results"""
+        query = self._normalize(embedding)
+        if query is None:
+            return None
+
+        with self._lock:
+            if self._size:
+                similarities = self._keys[:self._size] @ query
+                similarities[self._expires[:self._size] < time.monotonic()] = -1.0
+
+                slot = int(np.argmax(similarities))
+                cached_top_k, results = self._entries[slot]
+
+                if 1.0 - similarities[slot] <= self.tolerance and cached_top_k >= top_k:
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return results[:top_k]
+
+            self.misses += 1
+            return None
+
+    def put(self, embedding: List[float], top_k: int, results: List[SearchResult]) -> None:
+        """Cache results for a query embedding, evicting the least recently used entry when full"""
+        key = self._normalize(embedding)
+        if key is None:
+            return
+
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot, _ = self._entries.popitem(last=False)
+
+            self._keys[slot] = key
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._entries[slot] = (top_k, results)
+
+    def clear(self) -> None:
+        """Drop all cached results (call whenever the indexed documents change)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache size and hit rate"""
+        total = self.hits + self.misses
+        return {
+            'size': self._size,
+            'capacity': self.capacity,
+            'tolerance': self.tolerance,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        """Convert an embedding to a unit-length float32 vector"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
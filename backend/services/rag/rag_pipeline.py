@@ -1,12 +1,19 @@
 from typing import List, Dict, Any, Optional, Tuple
 import logging
 import os
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
-from .document_processor import DocumentProcessor, DocumentContent
+from .document_processor import DocumentProcessor, DocumentContent, parse_and_split
 from .text_splitter import TextSplitter, TextChunk
 from .embedding_service import EmbeddingService
 from .vector_store import VectorStore, SearchResult
+from .proximity_cache import ProximityCache
+from .embed_cache import ChunkEmbeddingStore
 
 
 class RAGPipeline:
@@ -17,20 +24,33 @@ class RAGPipeline:
                  chunk_size: int = 1000,
                  chunk_overlap: int = 200,
                  embedding_model: str = None,
-                 db_path: str = None):
+                 db_path: str = None,
+                 embed_batch_size: int = 128,
+                 n_workers: int = None):
         
         self.collection_name = collection_name
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.n_workers = n_workers or max((os.cpu_count() or 1) - 1, 1)
         
         # Initialize components
         self.document_processor = DocumentProcessor()
         self.text_splitter = TextSplitter(chunk_size, chunk_overlap)
         self.embedding_service = EmbeddingService(model_name=embedding_model)
         self.vector_store = VectorStore(collection_name, db_path)
+        self.query_cache = ProximityCache(dimension=self.embedding_service.EMBEDDING_DIMENSION)
+        self.chunk_embeddings = ChunkEmbeddingStore(
+            os.path.join(os.path.dirname(os.path.abspath(self.vector_store.db_path)), "embedding_cache.db"),
+            dimension=self.embedding_service.EMBEDDING_DIMENSION
+        )
         
         self.logger = logging.getLogger(__name__)
         self._is_initialized = False
+        self._has_documents = False
+        
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        self._parse_pool_lock = threading.Lock()
     
     def initialize(self) -> bool:
         """Initialize all RAG components"""
@@ -55,6 +75,9 @@ class RAGPipeline:
         """Process single document through complete RAG pipeline"""
         self._ensure_initialized()
         
+        if Path(file_path).suffix.lower() == '.pdf':
+            return self.process_and_embed(file_path)
+        
         try:
             doc_content = self.document_processor.process_document(file_path)
             
@@ -71,25 +94,8 @@ class RAGPipeline:
                     'chunks_added': 0
                 }
             
-            chunk_texts = [chunk.content for chunk in chunks]
-            embeddings = self.embedding_service.generate_embeddings(chunk_texts)
-            
-            chunk_metadatas = []
-            for chunk in chunks:
-                metadata = chunk.metadata.copy()
-                metadata.update({
-                    'chunk_index': chunk.chunk_index,
-                    'start_char': chunk.start_char,
-                    'end_char': chunk.end_char,
-                    'embedding_model': self.embedding_service.model_name
-                })
-                chunk_metadatas.append(metadata)
-            
-            document_ids = self.vector_store.add_documents(
-                texts=chunk_texts,
-                embeddings=embeddings,
-                metadatas=chunk_metadatas
-            )
+            embeddings = self._embed_texts([chunk.content for chunk in chunks])
+            self._store_chunks(chunks, embeddings)
             
             return {
                 'success': True,
@@ -102,10 +108,100 @@ class RAGPipeline:
             }
             
         except Exception as e:
-            print(f"❌ RAG Pipeline: Failed to process document {file_path}")
-            print(f"📍 Error: {str(e)}")
-            import traceback
-            print(f"📍 Traceback: {traceback.format_exc()}")
+            self.logger.exception(f"Failed to process document {file_path}: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'document_id': None,
+                'chunks_added': 0,
+                'total_characters': 0,
+                'file_type': 'unknown'
+            }
+    
+    def process_and_embed(self, file_path: str) -> Dict[str, Any]:
+        """Process a PDF with page extraction and chunking overlapped with embedding"""
+        self._ensure_initialized()
+        
+        try:
+            metadata, pages = self.document_processor.stream_pdf(file_path)
+            
+            embedding_id = self.embedding_service.embedding_id
+            page_lengths = []
+            chunks = []
+            stored = {}       # chunk index -> embedding found in the persistent store
+            miss_keys = []    # store keys of the chunks sent to the model, in order
+            
+            def chunk_texts():
+                # Runs on the producer thread of encode_stream
+                def counted_pages():
+                    try:
+                        for page_text in pages:
+                            page_lengths.append(len(page_text))
+                            yield page_text
+                    finally:
+                        # Cancels outstanding page extraction when embedding stops early
+                        pages.close()
+                
+                def lookup(group):
+                    # Only chunks missing from the store reach the model
+                    keys, embeddings = self.chunk_embeddings.lookup(embedding_id, [chunk.content for chunk in group])
+                    first_index = len(chunks) - len(group)
+                    for offset, (chunk, key, embedding) in enumerate(zip(group, keys, embeddings)):
+                        if embedding is None:
+                            miss_keys.append(key)
+                            yield chunk.content
+                        else:
+                            stored[first_index + offset] = embedding
+                
+                group = []
+                for chunk in self.text_splitter.split_stream(counted_pages(), metadata):
+                    chunks.append(chunk)
+                    group.append(chunk)
+                    if len(group) == 32:  # one encode batch
+                        yield from lookup(group)
+                        group = []
+                if group:
+                    yield from lookup(group)
+            
+            batches = list(self.embedding_service.encode_stream(chunk_texts()))
+            
+            if not page_lengths:
+                raise ValueError("No readable text found in PDF. The PDF appears to be image-based and requires OCR processing.")
+            if not chunks:
+                return {
+                    'success': False,
+                    'error': 'No chunks generated from document',
+                    'document_id': None,
+                    'chunks_added': 0
+                }
+            
+            computed = np.concatenate(batches) if batches else None
+            if computed is not None:
+                self.chunk_embeddings.put_many(embedding_id, miss_keys, computed)
+            
+            # Stored embeddings at their chunk positions, freshly computed ones in between (in order)
+            embeddings = np.empty((len(chunks), self.embedding_service.EMBEDDING_DIMENSION), dtype=np.float32)
+            is_stored = np.zeros(len(chunks), dtype=bool)
+            for index, embedding in stored.items():
+                embeddings[index] = embedding
+                is_stored[index] = True
+            if computed is not None:
+                embeddings[~is_stored] = computed
+            
+            self._store_chunks(chunks, embeddings)
+            
+            return {
+                'success': True,
+                'document_id': metadata.get('filename', 'unknown'),
+                'chunks_added': len(chunks),
+                'total_characters': sum(page_lengths) + 2 * (len(page_lengths) - 1),
+                'file_type': 'application/pdf',
+                'chunk_stats': self.text_splitter.get_chunk_stats(chunks),
+                'embedding_dimension': self.embedding_service.EMBEDDING_DIMENSION
+            }
+            
+        except Exception as e:
+            self.logger.exception(f"Failed to process document {file_path}: {e}")
             return {
                 'success': False,
                 'error': str(e),
@@ -115,6 +211,89 @@ class RAGPipeline:
                 'file_type': 'unknown'
             }
     
+    def _parse_and_split_all(self, file_paths: List[str]) -> List[Any]:
+        """Extract and split documents in worker processes; returns (file_type, chunks) or the error per file"""
+        if len(file_paths) > 1 and self.n_workers > 1:
+            try:
+                pool = self._get_parse_pool()
+                futures = [pool.submit(parse_and_split, file_path, self.chunk_size, self.chunk_overlap)
+                           for file_path in file_paths]
+                return [self._parse_outcome(future.result) for future in futures]
+            except BrokenProcessPool as e:
+                self.logger.warning(f"Parallel document parsing failed, parsing serially: {e}")
+                with self._parse_pool_lock:
+                    self._parse_pool = None
+        
+        return [self._parse_outcome(self._parse_and_split, file_path) for file_path in file_paths]
+    
+    def _parse_and_split(self, file_path: str) -> Tuple[str, List[TextChunk]]:
+        """Extract and split one document in this process"""
+        doc_content = self.document_processor.process_document(file_path)
+        return doc_content.file_type, self.text_splitter.split_text(doc_content.text, doc_content.metadata)
+    
+    @staticmethod
+    def _parse_outcome(parse, *args) -> Any:
+        """Run a parse step, returning its error instead of raising (a broken pool still raises)"""
+        try:
+            file_type, chunks = parse(*args)
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            return e
+        if not chunks:
+            return ValueError('No chunks generated from document')
+        return file_type, chunks
+    
+    def _get_parse_pool(self) -> ProcessPoolExecutor:
+        """Get the document parsing pool, starting it on first use"""
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                # spawn: forking a process that already runs threads is unsafe
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.n_workers,
+                                                       mp_context=multiprocessing.get_context("spawn"))
+            return self._parse_pool
+    
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed chunk texts, taking previously seen chunks from the persistent store"""
+        embedding_id = self.embedding_service.embedding_id
+        keys, embeddings = self.chunk_embeddings.lookup(embedding_id, texts)
+        
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if misses:
+            miss_texts = [texts[i] for i in misses]
+            computed = np.concatenate([
+                self.embedding_service.generate_embeddings(miss_texts[start:start + self.embed_batch_size])
+                for start in range(0, len(miss_texts), self.embed_batch_size)
+            ])
+            self.chunk_embeddings.put_many(embedding_id, [keys[i] for i in misses], computed)
+            for i, embedding in zip(misses, computed):
+                embeddings[i] = embedding
+        
+        if not embeddings:
+            return np.empty((0, self.embedding_service.EMBEDDING_DIMENSION), dtype=np.float32)
+        return np.stack(embeddings)
+    
+    def _store_chunks(self, chunks: List[TextChunk], embeddings: np.ndarray) -> None:
+        """Add embedded chunks to the vector store"""
+        chunk_metadatas = []
+        for chunk in chunks:
+            metadata = chunk.metadata.copy()
+            metadata.update({
+                'chunk_index': chunk.chunk_index,
+                'start_char': chunk.start_char,
+                'end_char': chunk.end_char,
+                'embedding_model': self.embedding_service.embedding_id
+            })
+            chunk_metadatas.append(metadata)
+        
+        self.vector_store.add_documents(
+            texts=[chunk.content for chunk in chunks],
+            embeddings=embeddings,
+            metadatas=chunk_metadatas
+        )
+        self.query_cache.clear()
+        self._has_documents = True
+    
     def process_multiple_documents(self, file_paths: List[str]) -> Dict[str, Any]:
         """Process multiple documents"""
         self._ensure_initialized()
@@ -128,23 +307,50 @@ class RAGPipeline:
             'processed_files': []
         }
         
-        for file_path in file_paths:
-            result = self.process_document(file_path)
-            
-            if result['success']:
-                results['successful'] += 1
-                results['total_chunks'] += result['chunks_added']
-                results['processed_files'].append({
-                    'file': file_path,
-                    'chunks': result['chunks_added'],
-                    'file_type': result.get('file_type', 'unknown')
-                })
-            else:
+        # Phase A: extract and split every document in worker processes (CPU/IO bound)
+        all_chunks: List[TextChunk] = []
+        doc_boundaries: List[Tuple[str, str, int, int]] = []  # (file, file_type, start, end) into all_chunks
+        
+        for file_path, outcome in zip(file_paths, self._parse_and_split_all(file_paths)):
+            if isinstance(outcome, Exception):
+                self.logger.error(f"Failed to process document {file_path}: {outcome}")
                 results['failed'] += 1
-                results['errors'].append({
-                    'file': file_path,
-                    'error': result['error']
-                })
+                results['errors'].append({'file': file_path, 'error': str(outcome)})
+                continue
+            
+            file_type, chunks = outcome
+            doc_boundaries.append((file_path, file_type, len(all_chunks), len(all_chunks) + len(chunks)))
+            all_chunks.extend(chunks)
+        
+        # Phase B: embed the chunks of all documents together, in large fixed-size batches
+        embeddings = None
+        if all_chunks:
+            try:
+                embeddings = self._embed_texts([chunk.content for chunk in all_chunks])
+            except Exception as e:
+                self.logger.exception(f"Failed to embed batch of {len(all_chunks)} chunks: {e}")
+                for file_path, _, _, _ in doc_boundaries:
+                    results['failed'] += 1
+                    results['errors'].append({'file': file_path, 'error': str(e)})
+                doc_boundaries = []
+        
+        # Phase C: store each document's slice
+        for file_path, file_type, start, end in doc_boundaries:
+            try:
+                self._store_chunks(all_chunks[start:end], embeddings[start:end])
+            except Exception as e:
+                self.logger.exception(f"Failed to store document {file_path}: {e}")
+                results['failed'] += 1
+                results['errors'].append({'file': file_path, 'error': str(e)})
+                continue
+            
+            results['successful'] += 1
+            results['total_chunks'] += end - start
+            results['processed_files'].append({
+                'file': file_path,
+                'chunks': end - start,
+                'file_type': file_type
+            })
         
         self.logger.info(f"Batch processing completed: {results['successful']}/{results['total_documents']} successful")
         return results
@@ -163,18 +369,27 @@ class RAGPipeline:
             # Generate query embedding
             query_embedding = self.embedding_service.generate_embedding(query)
             
-            # Search similar documents
-            results = self.vector_store.search_similar(
-                query_embedding=query_embedding,
-                n_results=top_k,
-                metadata_filter=metadata_filter
-            )
+            # Reuse results of a near-identical earlier query (unfiltered searches only)
+            results = None
+            if metadata_filter is None:
+                results = self.query_cache.get(query_embedding, top_k)
             
-            # Filter by similarity threshold
-            filtered_results = [
-                result for result in results 
-                if result.similarity_score >= similarity_threshold
-            ]
+            if results is None:
+                # Search similar documents
+                results = self.vector_store.search_similar(
+                    query_embedding=query_embedding,
+                    n_results=top_k,
+                    metadata_filter=metadata_filter
+                )
+                if metadata_filter is None:
+                    self.query_cache.put(query_embedding, top_k, results)
+            
+            # Filter by similarity threshold; results are ordered best first, so stop at the first miss
+            filtered_results = []
+            for result in results:
+                if result.similarity_score < similarity_threshold:
+                    break
+                filtered_results.append(result)
             
             self.logger.info(f"Query returned {len(filtered_results)} results above threshold {similarity_threshold}")
             return filtered_results
@@ -192,9 +407,10 @@ class RAGPipeline:
         if not search_results:
             return ""
         
-        # Build context from search results
+        # Build context from search results; the budget includes the separators between parts
+        separator = "\n---\n"
         context_parts = []
-        current_length = 0
+        budget = max_context_length
         
         for result in search_results:
             content = result.content.strip()
@@ -203,19 +419,54 @@ class RAGPipeline:
             source = result.metadata.get('filename', 'Unknown source')
             formatted_content = f"[Source: {source}]\n{content}\n"
             
+            remaining_space = budget - (len(separator) if context_parts else 0)
+            
             # Check if adding this would exceed max length
-            if current_length + len(formatted_content) > max_context_length:
+            if len(formatted_content) > remaining_space:
                 # Try to add partial content
-                remaining_space = max_context_length - current_length
                 if remaining_space > 100:  # Only add if meaningful space left
-                    truncated = formatted_content[:remaining_space-3] + "..."
-                    context_parts.append(truncated)
+                    context_parts.append(f"{formatted_content[:remaining_space - 3]}...")
                 break
             
             context_parts.append(formatted_content)
-            current_length += len(formatted_content)
+            budget = remaining_space - len(formatted_content)
+            if budget <= len(separator):
+                break
+        
+        return separator.join(context_parts)
+    
+    def has_documents(self) -> bool:
+        """Check whether any chunks are indexed, without loading the pipeline on demand"""
+        if not self._is_initialized:
+            return False
+        # Stay true once seen; while empty, re-check since another worker may have indexed a file
+        if not self._has_documents:
+            self._has_documents = self.vector_store.count() > 0
+        return self._has_documents
+    
+    def count_document_chunks(self, file_path: str) -> int:
+        """Count chunks already indexed for a stored file with the current embedding model"""
+        self._ensure_initialized()
+        return self.vector_store.count_by_metadata({
+            'filename': Path(file_path).name,
+            'embedding_model': self.embedding_service.embedding_id
+        })
+    
+    def delete_stale_chunks(self, file_path: str) -> bool:
+        """Delete chunks of a stored file that were not embedded by the current model"""
+        self._ensure_initialized()
+        filename = Path(file_path).name
+        current_chunks = self.count_document_chunks(file_path)
+        if self.vector_store.count_by_metadata({'filename': filename}) == current_chunks:
+            return False
         
-        return "\n---\n".join(context_parts)
+        # Chunks indexed before the model was recorded carry no embedding_model at all
+        if current_chunks:
+            stale_filter = {'filename': filename, 'embedding_model': {'$ne': self.embedding_service.embedding_id}}
+        else:
+            stale_filter = {'filename': filename}
+        self.query_cache.clear()
+        return self.vector_store.delete_by_metadata(stale_filter)
     
     def delete_document(self, filename: str) -> bool:
         """Delete all chunks of a specific document"""
@@ -225,6 +476,8 @@ class RAGPipeline:
             success = self.vector_store.delete_by_metadata(
                 metadata_filter={'filename': filename}
             )
+            self.query_cache.clear()
+            self._has_documents = False
             
             if success:
                 self.logger.info(f"Deleted document: {filename}")
@@ -252,6 +505,8 @@ class RAGPipeline:
                 'chunk_overlap': self.chunk_overlap,
                 'vector_store': vector_stats,
                 'embedding_service': embedding_info,
+                'query_cache': self.query_cache.get_stats(),
+                'chunk_embedding_store': self.chunk_embeddings.get_stats(),
                 'supported_formats': list(self.document_processor.SUPPORTED_FORMATS.keys())
             }
             
@@ -265,6 +520,8 @@ class RAGPipeline:
         
         try:
             success = self.vector_store.reset_collection()
+            self.query_cache.clear()
+            self._has_documents = False
             if success:
                 self.logger.info("Pipeline reset successfully")
             return success
@@ -1,6 +1,7 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 
 @dataclass
@@ -53,6 +54,42 @@ class TextSplitter:
         
         return self._create_text_chunks(chunks, text, metadata)
     
+    def split_stream(self, parts: Iterable[str], metadata: Dict[str, Any] = None,
+                     segment_size: int = None) -> Iterator[TextChunk]:
+        """Split text arriving in parts (e.g. pages, joined by blank lines) into chunks as it arrives.
+        
+        Parts are grouped into segments of at least segment_size characters that
+        are split on their own, so chunks never span a segment boundary; offsets
+        and indexes refer to the whole joined text.
+        """
+        segment_size = segment_size or self.chunk_size * 16
+        segment: List[str] = []
+        segment_length = 0
+        base_offset = 0
+        base_index = 0
+        
+        def flush() -> Iterator[TextChunk]:
+            nonlocal base_offset, base_index
+            segment_text = '\n\n'.join(segment)
+            chunks = self.split_text(segment_text, metadata)
+            for chunk in chunks:
+                yield replace(chunk,
+                              chunk_index=base_index + chunk.chunk_index,
+                              start_char=base_offset + chunk.start_char,
+                              end_char=base_offset + chunk.end_char)
+            base_offset += len(segment_text) + 2
+            base_index += len(chunks)
+        
+        for part in parts:
+            segment.append(part)
+            segment_length += len(part)
+            if segment_length >= segment_size:
+                yield from flush()
+                segment, segment_length = [], 0
+        
+        if segment:
+            yield from flush()
+    
     def split_documents(self, documents: List[Dict[str, Any]]) -> List[TextChunk]:
         """Split multiple documents into chunks"""
         all_chunks = []
@@ -70,14 +107,15 @@ class TextSplitter:
                            metadata: Dict[str, Any]) -> List[TextChunk]:
         """Create TextChunk objects with position tracking"""
         text_chunks = []
-        current_position = 0
+        search_from = 0
         
         for i, chunk_content in enumerate(chunks):
-            # Find chunk position in original text
-            start_pos = original_text.find(chunk_content, current_position)
+            # Chunks come in order and overlap the previous one by at most chunk_overlap
+            # characters, so the search starts just before its end instead of rescanning
+            start_pos = original_text.find(chunk_content, search_from)
             if start_pos == -1:
                 # Fallback if exact match not found
-                start_pos = current_position
+                start_pos = search_from
             
             end_pos = start_pos + len(chunk_content)
             
@@ -99,18 +137,13 @@ class TextSplitter:
             )
             
             text_chunks.append(text_chunk)
-            current_position = start_pos + len(chunk_content)
+            search_from = max(start_pos + 1, start_pos + len(chunk_content) - self.chunk_overlap)
         
         return text_chunks
     
     def _count_sentences(self, text: str) -> int:
         """Count sentences in text using English punctuation"""
-        sentence_endings = ['.', '!', '?']
-        count = 0
-        
-        for char in text:
-            if char in sentence_endings:
-                count += 1
+        count = text.count('.') + text.count('!') + text.count('?')
         
         return max(1, count)  # Minimum 1 sentence
     
@@ -119,14 +152,16 @@ class TextSplitter:
         if not chunks:
             return {}
         
-        chunk_sizes = [len(chunk.content) for chunk in chunks]
-        word_counts = [chunk.metadata.get('word_count', 0) for chunk in chunks]
+        chunk_sizes = np.fromiter((len(chunk.content) for chunk in chunks), dtype=np.int64, count=len(chunks))
+        word_counts = np.fromiter((chunk.metadata.get('word_count', 0) for chunk in chunks),
+                                  dtype=np.int64, count=len(chunks))
         
+        # Plain Python numbers, so the stats stay JSON serializable
         return {
             'total_chunks': len(chunks),
-            'avg_chunk_size': sum(chunk_sizes) / len(chunk_sizes),
-            'min_chunk_size': min(chunk_sizes),
-            'max_chunk_size': max(chunk_sizes),
-            'avg_word_count': sum(word_counts) / len(word_counts),
-            'total_characters': sum(chunk_sizes)
+            'avg_chunk_size': float(chunk_sizes.mean()),
+            'min_chunk_size': int(chunk_sizes.min()),
+            'max_chunk_size': int(chunk_sizes.max()),
+            'avg_word_count': float(word_counts.mean()),
+            'total_characters': int(chunk_sizes.sum())
         } 
\ No newline at end of file
@@ -1,10 +1,16 @@
 import chromadb
 import uuid
-from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Union
 from chromadb.config import Settings
 from dataclasses import dataclass
 import logging
 import os
+import threading
+from collections import Counter
+
+
+CHROMA_METADATA_TYPES = (str, int, float, bool)
 
 
 @dataclass
@@ -20,6 +26,7 @@ class VectorStore:
     
     DEFAULT_COLLECTION_NAME = "rag_documents"
     DEFAULT_DB_PATH = "./data/chroma_db"
+    BATCH_SIZE = 512  # records per collection.add call
     
     def __init__(self, collection_name: str = None, db_path: str = None):
         self.collection_name = collection_name or self.DEFAULT_COLLECTION_NAME
@@ -29,6 +36,10 @@ class VectorStore:
         self.collection = None
         self._is_initialized = False
         
+        # Chunks per filename, kept up to date by this instance; None until first scanned
+        self._filename_counts: Optional[Counter] = None
+        self._counts_lock = threading.Lock()
+        
         self.logger = logging.getLogger(__name__)
     
     def initialize(self) -> None:
@@ -60,13 +71,13 @@ class VectorStore:
             raise RuntimeError(f"Could not initialize vector store: {e}")
     
     def add_documents(self, texts: List[str], 
-                     embeddings: List[List[float]], 
+                     embeddings: Union[List[List[float]], np.ndarray], 
                      metadatas: List[Dict[str, Any]],
                      document_ids: List[str] = None) -> List[str]:
         """Add documents to vector store"""
         self._ensure_initialized()
         
-        if not texts or not embeddings or not metadatas:
+        if not texts or not len(embeddings) or not metadatas:
             return []
         
         if len(texts) != len(embeddings) or len(texts) != len(metadatas):
@@ -78,13 +89,18 @@ class VectorStore:
         
         try:
             processed_metadatas = self._process_metadatas(metadatas)
+            embeddings = np.asarray(embeddings, dtype=np.float32)
             
-            self.collection.add(
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=processed_metadatas,
-                ids=document_ids
-            )
+            # Fixed-size batches keep each insert's payload small; row slices are views
+            for start in range(0, len(texts), self.BATCH_SIZE):
+                end = start + self.BATCH_SIZE
+                self.collection.add(
+                    documents=texts[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=processed_metadatas[start:end],
+                    ids=document_ids[start:end]
+                )
+                self._count_added(processed_metadatas[start:end])
             
             self.logger.info(f"Added {len(texts)} documents to vector store")
             return document_ids
@@ -150,6 +166,7 @@ class VectorStore:
         
         try:
             self.collection.delete(ids=document_ids)
+            self._invalidate_counts()
             self.logger.info(f"Deleted {len(document_ids)} documents")
             return True
             
@@ -164,6 +181,7 @@ class VectorStore:
         try:
             where_clause = self._build_where_clause(metadata_filter)
             self.collection.delete(where=where_clause)
+            self._count_deleted(metadata_filter)
             self.logger.info(f"Deleted documents with filter: {metadata_filter}")
             return True
             
@@ -171,6 +189,30 @@ class VectorStore:
             self.logger.error(f"Failed to delete by metadata: {e}")
             return False
     
+    def count(self) -> int:
+        """Count all stored chunks"""
+        self._ensure_initialized()
+        
+        try:
+            return self.collection.count()
+            
+        except Exception as e:
+            self.logger.error(f"Failed to count documents: {e}")
+            return 0
+    
+    def count_by_metadata(self, metadata_filter: Dict[str, Any]) -> int:
+        """Count documents matching a metadata filter"""
+        self._ensure_initialized()
+        
+        try:
+            where_clause = self._build_where_clause(metadata_filter)
+            results = self.collection.get(where=where_clause, include=[])
+            return len(results['ids'])
+            
+        except Exception as e:
+            self.logger.error(f"Failed to count by metadata: {e}")
+            return 0
+    
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get collection statistics"""
         self._ensure_initialized()
@@ -179,23 +221,14 @@ class VectorStore:
             # Get total chunk count
             total_chunks = self.collection.count()
             
-            # Get all unique filenames to count documents
-            if total_chunks > 0:
-                # Query all records to get unique filenames
-                all_results = self.collection.get(
-                    include=['metadatas']
-                )
-                
-                # Count unique documents based on filename
-                unique_filenames = set()
-                if all_results['metadatas']:
-                    for metadata in all_results['metadatas']:
-                        filename = metadata.get('filename', 'unknown')
-                        unique_filenames.add(filename)
-                
-                document_count = len(unique_filenames)
-            else:
-                document_count = 0
+            # Documents are unique filenames; the cached counts are only rescanned
+            # when they no longer add up, e.g. after another process wrote
+            with self._counts_lock:
+                counts = self._filename_counts
+                if counts is None or sum(counts.values()) != total_chunks:
+                    counts = self._scan_filename_counts() if total_chunks > 0 else Counter()
+                    self._filename_counts = counts
+                document_count = len(counts)
             
             return {
                 'collection_name': self.collection_name,
@@ -223,6 +256,8 @@ class VectorStore:
                 name=self.collection_name,
                 metadata={"description": "RAG document embeddings"}
             )
+            with self._counts_lock:
+                self._filename_counts = Counter()
             self.logger.info(f"Reset collection: {self.collection_name}")
             return True
             
@@ -230,6 +265,32 @@ class VectorStore:
             self.logger.error(f"Failed to reset collection: {e}")
             return False
     
+    def _scan_filename_counts(self) -> Counter:
+        """Count chunks per filename by reading every record's metadata"""
+        all_results = self.collection.get(include=['metadatas'])
+        return Counter(metadata.get('filename', 'unknown') for metadata in all_results['metadatas'] or [])
+    
+    def _count_added(self, metadatas: List[Dict[str, Any]]) -> None:
+        """Account for newly added chunks in the cached counts"""
+        with self._counts_lock:
+            if self._filename_counts is not None:
+                self._filename_counts.update(metadata.get('filename', 'unknown') for metadata in metadatas)
+    
+    def _count_deleted(self, metadata_filter: Dict[str, Any]) -> None:
+        """Account for a delete by metadata in the cached counts"""
+        with self._counts_lock:
+            if self._filename_counts is None:
+                return
+            if set(metadata_filter) == {'filename'} and isinstance(metadata_filter['filename'], str):
+                self._filename_counts.pop(metadata_filter['filename'], None)
+            else:
+                self._filename_counts = None
+    
+    def _invalidate_counts(self) -> None:
+        """Drop the cached counts so the next stats call rescans"""
+        with self._counts_lock:
+            self._filename_counts = None
+    
     def _ensure_initialized(self) -> None:
         """Ensure vector store is initialized"""
         if not self._is_initialized:
@@ -237,27 +298,17 @@ class VectorStore:
     
     def _process_metadatas(self, metadatas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Process metadata for ChromaDB compatibility"""
-        processed = []
-        
-        for metadata in metadatas:
-            processed_metadata = {}
-            
-            for key, value in metadata.items():
-                # ChromaDB supports: str, int, float, bool
-                if isinstance(value, (str, int, float, bool)):
-                    processed_metadata[key] = value
-                elif value is None:
-                    processed_metadata[key] = ""
-                else:
-                    # Convert complex types to string
-                    processed_metadata[key] = str(value)
-            
-            processed.append(processed_metadata)
-        
-        return processed
+        # ChromaDB supports: str, int, float, bool; None becomes "" and complex types strings
+        return [
+            {key: value if isinstance(value, CHROMA_METADATA_TYPES) else "" if value is None else str(value)
+             for key, value in metadata.items()}
+            for metadata in metadatas
+        ]
     
     def _build_where_clause(self, metadata_filter: Dict[str, Any]) -> Dict[str, Any]:
         """Build ChromaDB where clause from metadata filter"""
+        if len(metadata_filter) > 1:
+            return {'$and': [{key: value} for key, value in metadata_filter.items()]}
         return metadata_filter
     
     def _parse_search_results(self, results: Dict[str, Any]) -> List[SearchResult]:
@@ -269,18 +320,17 @@ class VectorStore:
         
         documents = results['documents'][0]
         metadatas = results['metadatas'][0]
-        distances = results['distances'][0]
         ids = results['ids'][0]
         
+        # Convert ChromaDB cosine distance to similarity score
+        # ChromaDB cosine distance ranges from 0 to 2, where 0 is perfect match
+        similarity_scores = np.maximum(0.0, 1.0 - np.asarray(results['distances'][0], dtype=np.float64) / 2.0).tolist()
+        
         for i, doc_id in enumerate(ids):
-            # Convert ChromaDB cosine distance to similarity score
-            # ChromaDB cosine distance ranges from 0 to 2, where 0 is perfect match
-            similarity_score = max(0.0, 1.0 - (distances[i] / 2.0))
-            
             search_result = SearchResult(
                 content=documents[i],
                 metadata=metadatas[i],
-                similarity_score=similarity_score,
+                similarity_score=similarity_scores[i],
                 document_id=doc_id
             )
             
@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Optional, List, Dict, Any
+from cachetools import TTLCache
+from ..core.config import settings
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: in-process TTL LRU (L1) backed by Redis (L2)"""
+
+    KEY_PREFIX = "catbot:response:"
+
+    def __init__(self, redis_url: str = None, ttl: int = None,
+                 local_maxsize: int = 1024, local_ttl: int = 600):
+        self.ttl = ttl or settings.RESPONSE_CACHE_TTL
+        self._local = TTLCache(maxsize=local_maxsize, ttl=local_ttl)
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        redis_url = redis_url or settings.REDIS_URL
+        self._redis = None
+        if redis_url and REDIS_AVAILABLE:
+            try:
+                self._redis = aioredis.from_url(redis_url, decode_responses=True)
+            except Exception as e:
+                logger.warning("Redis response cache disabled: %s", e)
+
+    @staticmethod
+    def build_key(model_name: str, message: str, history: List[Dict[str, str]]) -> str:
+        """Build cache key from model name, canonical history and normalized message"""
+        history_json = json.dumps(history, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        history_hash = hashlib.sha256(history_json.encode("utf-8")).hexdigest()
+        normalized_message = " ".join(message.split()).lower()
+        raw_key = f"{model_name}|{history_hash}|{normalized_message}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Get cached response, checking L1 first and then L2"""
+        async with self._lock:
+            response = self._local.get(key)
+
+        if response is None and self._redis is not None:
+            try:
+                response = await self._redis.get(self.KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning("Redis cache read failed: %s", e)
+                response = None
+
+            if response is not None:
+                async with self._lock:
+                    self._local[key] = response
+
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def set(self, key: str, response: str) -> None:
+        """Store response in both cache tiers"""
+        async with self._lock:
+            self._local[key] = response
+
+        if self._redis is not None:
+            try:
+                await self._redis.setex(self.KEY_PREFIX + key, self.ttl, response)
+            except Exception as e:
+                logger.warning("Redis cache write failed: %s", e)
+
+    async def clear(self) -> None:
+        """Clear the in-process cache tier"""
+        async with self._lock:
+            self._local.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "local_entries": len(self._local),
+            "redis_enabled": self._redis is not None
+        }
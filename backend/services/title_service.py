@@ -1,6 +1,10 @@
 from typing import Optional
-from .llm_service import LLMModel
+from .llm_service import LLMModel, DEFAULT_MODEL
 import re
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 class TitleGenerationService:
     def __init__(self):
@@ -36,12 +40,12 @@ Only respond with the title, nothing else."""
 
         try:
             self.title_llm = LLMModel(
-                model_name="llama3",
+                model_name=DEFAULT_MODEL,
                 temperature=0.3,  
                 system_prompt=title_prompt
             )
         except Exception as e:
-            print(f"Title LLM initialization error: {e}")
+            logger.error("Title LLM initialization error: %s", e)
             self.title_llm = None
     
     def generate_title_from_message(self, user_message: str) -> str:
@@ -50,8 +54,6 @@ Only respond with the title, nothing else."""
             return self._fallback_title_generation(user_message)
         
         try:
-            self.title_llm.clear_history()
-            
             title = self.title_llm.get_response(user_message)
             
             title = self._clean_title(title)
@@ -63,7 +65,7 @@ Only respond with the title, nothing else."""
             return title if title else self._fallback_title_generation(user_message)
             
         except Exception as e:
-            print(f"Title generation error: {e}")
+            logger.error("Title generation error: %s", e)
             return self._fallback_title_generation(user_message)
     
     def generate_title_from_conversation(self, messages: list) -> str:
@@ -133,17 +135,19 @@ Only respond with the title, nothing else."""
         
         return title[:50] if title else "Yeni Sohbet"
     
-    def update_conversation_title(self, conversation_id: int, message: str, chat_repo) -> Optional[str]:
+    async def update_conversation_title(self, conversation_id: int, message: str, chat_repo) -> Optional[str]:
         """Update conversation title and return the new title"""
         try:
-            new_title = self.generate_title_from_message(message)
+            # The title LLM call is blocking; keep it off the event loop
+            loop = asyncio.get_running_loop()
+            new_title = await loop.run_in_executor(None, self.generate_title_from_message, message)
             
-            updated_conversation = chat_repo.update_conversation_title(conversation_id, new_title)
+            updated_conversation = await chat_repo.update_conversation_title(conversation_id, new_title)
             
             if updated_conversation:
                 return new_title
             
         except Exception as e:
-            print(f"Error updating conversation title: {e}")
+            logger.error("Error updating conversation title: %s", e)
         
         return None 
\ No newline at end of file
@@ -0,0 +1,350 @@
+import os
+import mmap
+import errno
+import asyncio
+import logging
+import platform
+import weakref
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import aiofiles
+
+try:
+    from liburing import (
+        Ring, Cqe, Iovec, io_uring_queue_init, io_uring_queue_exit, io_uring_register_eventfd,
+        io_uring_get_sqe, io_uring_prep_write, io_uring_prep_writev, io_uring_prep_read, io_uring_sqe_set_data64,
+        io_uring_submit, io_uring_cq_ready, io_uring_peek_cqe, io_uring_cqe_seen
+    )
+    LIBURING_AVAILABLE = True
+except ImportError:
+    LIBURING_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MIN_KERNEL = (5, 10)
+DIRECT_IO_ALIGNMENT = 4096
+ALIGNED_BUFFER_SIZE = 1024 * 1024  # multiple of DIRECT_IO_ALIGNMENT
+
+
+def _kernel_supported() -> bool:
+    """Check for a Linux kernel with a mature io_uring (5.10+)"""
+    if platform.system() != "Linux":
+        return False
+    try:
+        major, minor = platform.release().split(".")[:2]
+        return (int(major), int(minor.split("-")[0])) >= MIN_KERNEL
+    except ValueError:
+        return False
+
+
+class AlignedBuffer:
+    """Page aligned staging buffer for O_DIRECT writes.
+
+    The liburing bindings keep a reference to every view handed to Iovec, so
+    the iovecs are cached per write length and the buffer itself is pooled and
+    reused instead of being closed.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.memory = mmap.mmap(-1, size)  # anonymous maps are page aligned
+        self._iovecs: Dict[int, Any] = {}
+
+    def iovec(self, length: int) -> Any:
+        """Iovec over the first length bytes"""
+        iovec = self._iovecs.get(length)
+        if iovec is None:
+            iovec = self._iovecs[length] = Iovec([memoryview(self.memory)[:length]])
+        return iovec
+
+
+class UringEngine:
+    """One io_uring per event loop, driven from the loop itself.
+
+    SQEs queued during a loop iteration are submitted together with one
+    io_uring_enter call. Completions are signalled through an eventfd the loop
+    watches, so no thread ever blocks (the bindings hold the GIL while waiting).
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, entries: int = 256):
+        self.loop = loop
+        self.ring = Ring()
+        io_uring_queue_init(entries, self.ring)
+        self.cqe = Cqe()
+
+        self.eventfd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        try:
+            io_uring_register_eventfd(self.ring, self.eventfd)
+        except BaseException:
+            os.close(self.eventfd)
+            io_uring_queue_exit(self.ring)
+            raise
+
+        # user_data -> (future, buffer); the buffer must stay alive until the kernel is done with it
+        self._pending: Dict[int, Tuple[asyncio.Future, Any]] = {}
+        self._next_id = 0
+        self._unsubmitted = 0
+        self._buffers: List[AlignedBuffer] = []
+        loop.add_reader(self.eventfd, self._reap)
+
+    def write(self, fd: int, data: bytes, offset: int) -> asyncio.Future:
+        """Queue a write of data at offset; resolves to the number of bytes written"""
+        return self._queue(io_uring_prep_write, fd, data, offset)
+
+    def write_aligned(self, fd: int, buffer: AlignedBuffer, length: int, offset: int) -> asyncio.Future:
+        """Queue a write of the first length bytes of an aligned buffer (required for O_DIRECT files)"""
+        # io_uring_prep_write only takes bytes, whose data is never page aligned; writev takes views
+        return self._queue(io_uring_prep_writev, fd, buffer.iovec(length), offset, keepalive=buffer)
+
+    def acquire_buffer(self) -> AlignedBuffer:
+        """Take a staging buffer from the pool"""
+        return self._buffers.pop() if self._buffers else AlignedBuffer(ALIGNED_BUFFER_SIZE)
+
+    def release_buffer(self, buffer: AlignedBuffer) -> None:
+        """Return a staging buffer to the pool"""
+        self._buffers.append(buffer)
+
+    def read(self, fd: int, buffer: bytearray, offset: int) -> asyncio.Future:
+        """Queue a read into buffer from offset; resolves to the number of bytes read"""
+        return self._queue(io_uring_prep_read, fd, buffer, offset)
+
+    def close(self) -> None:
+        """Tear down the ring (pending operations are cancelled)"""
+        self.loop.remove_reader(self.eventfd)
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+        io_uring_queue_exit(self.ring)
+        os.close(self.eventfd)
+
+    def _queue(self, prep, fd: int, buffer: Any, offset: int, keepalive: Any = None) -> asyncio.Future:
+        """Prepare an SQE and schedule a batched submit at the end of this loop iteration"""
+        sqe = io_uring_get_sqe(self.ring)
+        if sqe is None:
+            # Submission queue full: flush it now and take the freed slot
+            self._submit()
+            sqe = io_uring_get_sqe(self.ring)
+
+        user_data = self._next_id
+        self._next_id += 1
+        prep(sqe, fd, buffer, offset)
+        io_uring_sqe_set_data64(sqe, user_data)
+
+        future = self.loop.create_future()
+        self._pending[user_data] = (future, (buffer, keepalive))
+
+        if self._unsubmitted == 0:
+            self.loop.call_soon(self._submit)
+        self._unsubmitted += 1
+        return future
+
+    def _submit(self) -> None:
+        """Hand all prepared SQEs to the kernel"""
+        if self._unsubmitted:
+            self._unsubmitted = 0
+            io_uring_submit(self.ring)
+
+    def _reap(self) -> None:
+        """Resolve the futures of all completed operations"""
+        try:
+            os.eventfd_read(self.eventfd)
+        except BlockingIOError:
+            pass
+
+        while io_uring_cq_ready(self.ring):
+            io_uring_peek_cqe(self.ring, self.cqe)
+            entry = self.cqe[0]
+            user_data = entry.user_data
+            try:
+                result, error = entry.res, None
+            except OSError as e:
+                result, error = None, e
+            io_uring_cqe_seen(self.ring, entry)
+
+            future, _ = self._pending.pop(user_data, (None, None))
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_engines: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Optional[UringEngine]]" = weakref.WeakKeyDictionary()
+
+
+def get_uring_engine() -> Optional[UringEngine]:
+    """Get the io_uring engine of the running loop, or None when io_uring is unusable here"""
+    if not LIBURING_AVAILABLE:
+        return None
+
+    loop = asyncio.get_running_loop()
+    if loop in _engines:
+        return _engines[loop]
+
+    engine = None
+    if _kernel_supported():
+        try:
+            engine = UringEngine(loop)
+        except (OSError, NotImplementedError, RuntimeError) as e:
+            # e.g. io_uring disabled by seccomp or sysctl
+            logger.warning("io_uring unavailable, using thread pool file I/O: %s", e)
+
+    _engines[loop] = engine
+    return engine
+
+
+class UringFile:
+    """Minimal async binary file on io_uring with the aiofiles calls FileService uses.
+
+    With direct=True a 'wb' file is opened with O_DIRECT and written through a
+    page aligned staging buffer, bypassing the page cache. The last block is
+    zero padded and the file truncated back to its exact size on close.
+    """
+
+    FLAGS = {
+        'wb': os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+        'rb': os.O_RDONLY
+    }
+
+    def __init__(self, path: Union[str, os.PathLike], mode: str, engine: UringEngine, direct: bool = False):
+        if mode not in self.FLAGS:
+            raise ValueError(f"Unsupported mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.engine = engine
+        self.direct = direct and mode == 'wb'
+        self.fd: Optional[int] = None
+        self.position = 0
+
+        self._staging: Optional[AlignedBuffer] = None
+        self._staged = 0
+        # Operation the kernel may still be running against fd and its buffer
+        self._inflight: Optional[asyncio.Future] = None
+
+    async def __aenter__(self) -> "UringFile":
+        flags = self.FLAGS[self.mode] | os.O_CLOEXEC
+        if self.direct:
+            try:
+                self.fd = await asyncio.to_thread(os.open, self.path, flags | os.O_DIRECT, 0o644)
+                self._staging = self.engine.acquire_buffer()
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                # Filesystem without O_DIRECT support (e.g. tmpfs)
+                self.direct = False
+
+        if self.fd is None:
+            self.fd = await asyncio.to_thread(os.open, self.path, flags, 0o644)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if self._staging is not None and exc_type is None:
+                await self._flush_staging()
+        finally:
+            inflight = self._inflight
+            if inflight is not None and not inflight.done():
+                # A cancelled caller left an operation running; the buffer and fd
+                # may only be released once its completion has been reaped
+                try:
+                    await asyncio.shield(inflight)
+                except asyncio.CancelledError:
+                    if not inflight.done():
+                        inflight.add_done_callback(lambda _: self._release())
+                        raise
+                except Exception:
+                    pass
+            self._release()
+
+    def _release(self) -> None:
+        """Return the staging buffer to the pool and close the file"""
+        if self._staging is not None:
+            self.engine.release_buffer(self._staging)
+            self._staging = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    async def _complete(self, future: asyncio.Future) -> int:
+        """Await an engine operation without cancelling it along with the caller"""
+        self._inflight = future
+        result = await asyncio.shield(future)
+        self._inflight = None
+        return result
+
+    async def write(self, data: bytes) -> int:
+        """Write data at the current position"""
+        if self._staging is not None:
+            return await self._write_direct(data)
+
+        data = bytes(data)
+        remaining = data
+        while remaining:
+            written = await self._complete(self.engine.write(self.fd, remaining, self.position))
+            self.position += written
+            remaining = remaining[written:]
+        return len(data)
+
+    async def _write_direct(self, data: bytes) -> int:
+        """Copy data into the aligned staging buffer, writing it out whenever it fills up"""
+        view = memoryview(data)
+        while view:
+            count = min(len(view), self._staging.size - self._staged)
+            self._staging.memory[self._staged:self._staged + count] = view[:count]
+            self._staged += count
+            view = view[count:]
+
+            if self._staged == self._staging.size:
+                await self._write_staging(self._staging.size)
+        return len(data)
+
+    async def _write_staging(self, length: int) -> None:
+        """Write the first length bytes of the staging buffer (length is block aligned)"""
+        written = await self._complete(self.engine.write_aligned(self.fd, self._staging, length, self.position))
+        if written != length:
+            # O_DIRECT cannot resume from an unaligned offset; a short write here means a full disk
+            raise OSError(errno.EIO, f"Short direct write to {self.path}: {written} of {length} bytes")
+        self.position += self._staged
+        self._staged = 0
+
+    async def _flush_staging(self) -> None:
+        """Write the zero padded tail block and truncate the file to its real size"""
+        if not self._staged:
+            return
+
+        size = self.position + self._staged
+        padded = -(-self._staged // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+        self._staging.memory[self._staged:padded] = bytes(padded - self._staged)
+        await self._write_staging(padded)
+        os.ftruncate(self.fd, size)
+
+    async def read(self, size: int = -1) -> bytes:
+        """Read size bytes (everything left when negative) from the current position"""
+        if size < 0:
+            size = max(os.fstat(self.fd).st_size - self.position, 0)
+
+        buffer = bytearray(size)
+        filled = await self._complete(self.engine.read(self.fd, buffer, self.position)) if size else 0
+        del buffer[filled:]
+
+        # Short reads are rare for regular files; finish them with follow-up reads
+        while 0 < filled < size:
+            chunk = bytearray(size - filled)
+            count = await self._complete(self.engine.read(self.fd, chunk, self.position + filled))
+            if count == 0:
+                break
+            buffer += chunk[:count]
+            filled += count
+
+        self.position += filled
+        return bytes(buffer)
+
+
+def open_file(path: Union[str, os.PathLike], mode: str, direct: bool = False):
+    """Open a file for async I/O on io_uring when available, otherwise through aiofiles"""
+    engine = get_uring_engine()
+    if engine is not None and mode in UringFile.FLAGS:
+        return UringFile(path, mode, engine, direct=direct)
+    return aiofiles.open(path, mode)
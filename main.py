@@ -9,7 +9,8 @@ def run_backend():
 
     try:
         from backend.api import start_server
-        start_server(host="127.0.0.1", port=8000)
+        # Worker processes can only be supervised from the main thread
+        start_server(host="127.0.0.1", port=8000, workers=1)
     except Exception as e:
         pass
 
@@ -0,0 +1,20 @@
+from contextlib import asynccontextmanager
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from backend.database.database import create_tables_and_indexes, set_sqlite_pragmas
+
+
+@asynccontextmanager
+async def open_database(path):
+    """Session factory over a fresh database with the app's pragmas, migrations and search index"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    async with engine.begin() as conn:
+        await conn.run_sync(create_tables_and_indexes)
+
+    try:
+        yield async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    finally:
+        await engine.dispose()
@@ -0,0 +1,148 @@
+import json
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from sqlalchemy import func, select, text
+
+from backend.database.database import FTS5_AVAILABLE
+from backend.database.models import File, Message
+from backend.repositories.chat_repository import ChatRepository
+from backend.repositories.file_repository import FileRepository
+from tests.database import open_database
+
+
+def isoformat_values(value):
+    """Render datetimes the way the API serializes them"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: isoformat_values(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [isoformat_values(item) for item in value]
+    return value
+
+
+async def build_conversation_outputs(path):
+    async with open_database(path) as session_factory:
+        async with session_factory() as db:
+            chat_repo = ChatRepository(db)
+
+            # Server default timestamps (second resolution), updated_at set through UPDATE ... RETURNING
+            chatted = await chat_repo.get_or_create_conversation()
+            await chat_repo.add_message(chatted.id, "user", "hello", snapshot=chatted)
+            await chat_repo.finalize_turn(chatted.id, "hi there", snapshot=chatted)
+
+            # Python datetimes with microseconds
+            imported = await chat_repo.get_or_create_conversation()
+            await chat_repo.add_messages(imported.id, [("user", "again"), ("assistant", "still here")])
+
+            conversation_ids = [chatted.id, imported.id]
+            as_json = [await chat_repo.get_conversation_with_messages_json(conversation_id)
+                       for conversation_id in conversation_ids]
+
+        async with session_factory() as db:
+            as_dict = [await ChatRepository(db).get_conversation_with_messages(conversation_id)
+                       for conversation_id in conversation_ids]
+
+    return [json.loads(document) for document in as_json], as_dict
+
+
+def test_conversation_json_matches_dict_output(tmp_path):
+    from_json, from_dict = asyncio.run(build_conversation_outputs(tmp_path / "chat.db"))
+
+    assert [len(conversation["messages"]) for conversation in from_json] == [2, 2]
+    assert from_json == isoformat_values(from_dict)
+
+
+async def search_titles(session_factory, term):
+    async with session_factory() as db:
+        return sorted(conversation.title for conversation in await ChatRepository(db).search_conversations(term))
+
+
+@pytest.mark.skipif(not FTS5_AVAILABLE, reason="SQLite built without FTS5")
+def test_search_index_follows_inserts_updates_and_deletes(tmp_path):
+    async def scenario():
+        async with open_database(tmp_path / "chat.db") as session_factory:
+            async with session_factory() as db:
+                chat_repo = ChatRepository(db)
+                budget = await chat_repo.create_conversation("Quarterly budget")
+                await chat_repo.add_message(budget.id, "user", "Which kittens need vaccinations?")
+                pets = await chat_repo.create_conversation("Pets")
+                await chat_repo.add_message(pets.id, "user", "Kitten food brands")
+
+            # Title and message matches, prefix terms, porter stemming
+            assert await search_titles(session_factory, "budget") == ["Quarterly budget"]
+            assert await search_titles(session_factory, "kitten") == ["Pets", "Quarterly budget"]
+            assert await search_titles(session_factory, "vacc") == ["Quarterly budget"]
+            # User input is quoted, not parsed as query syntax
+            assert await search_titles(session_factory, 'budget" OR "pets') == []
+
+            async with session_factory() as db:
+                await ChatRepository(db).update_conversation_title(budget.id, "Annual plan")
+            assert await search_titles(session_factory, "budget") == []
+            assert await search_titles(session_factory, "annual") == ["Annual plan"]
+
+            async with session_factory() as db:
+                await ChatRepository(db).clear_conversation_messages(budget.id)
+            assert await search_titles(session_factory, "vaccinations") == []
+            assert await search_titles(session_factory, "kitten") == ["Pets"]
+
+            async with session_factory() as db:
+                await ChatRepository(db).delete_conversation(pets.id)
+            assert await search_titles(session_factory, "kitten") == []
+            assert await search_titles(session_factory, "pets") == []
+
+    asyncio.run(scenario())
+
+
+def test_add_messages_keeps_order_and_counts(tmp_path):
+    async def scenario():
+        async with open_database(tmp_path / "chat.db") as session_factory:
+            async with session_factory() as db:
+                chat_repo = ChatRepository(db)
+                conversation = await chat_repo.get_or_create_conversation()
+                await chat_repo.add_message(conversation.id, "user", "first", snapshot=conversation)
+
+                pairs = [("assistant" if index % 2 else "user", f"message {index}") for index in range(50)]
+                assert await chat_repo.add_messages(conversation.id, pairs) == 50
+                assert await chat_repo.add_messages(conversation.id, []) == 0
+
+            async with session_factory() as db:
+                chat_repo = ChatRepository(db)
+                messages = await chat_repo.get_conversation_messages(conversation.id)
+                stored = await chat_repo.get_conversation(conversation.id)
+
+            assert [(message.role, message.content) for message in messages] == [("user", "first")] + pairs
+            timestamps = [message.timestamp for message in messages[1:]]
+            assert timestamps == sorted(set(timestamps))
+            assert stored.message_count == 51
+            assert stored.updated_at == messages[-1].timestamp
+
+    asyncio.run(scenario())
+
+
+def test_delete_all_with_foreign_keys_enforced(tmp_path):
+    async def scenario():
+        async with open_database(tmp_path / "chat.db") as session_factory:
+            async with session_factory() as db:
+                assert (await db.execute(text("PRAGMA foreign_keys"))).scalar() == 1
+
+                chat_repo = ChatRepository(db)
+                file_repo = FileRepository(db)
+                for title in ("First", "Second"):
+                    conversation = await chat_repo.create_conversation(title)
+                    await chat_repo.add_messages(conversation.id, [("user", "hi"), ("assistant", "hello")])
+                    await file_repo.create_file(f"{title}.txt", f"uploads/{title}.txt", 10, "text/plain",
+                                                title.lower(), conversation_id=conversation.id)
+                unattached = await file_repo.create_file("loose.txt", "uploads/loose.txt", 10, "text/plain", "loose")
+
+                assert await chat_repo.delete_all() == 2
+
+            async with session_factory() as db:
+                assert await ChatRepository(db).get_conversations() == []
+                assert (await db.execute(select(func.count(Message.id)))).scalar_one() == 0
+                assert (await db.execute(select(File.id))).scalars().all() == [unattached.id]
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+import io
+import asyncio
+
+from fastapi import UploadFile
+
+from backend.database.models import File
+from backend.repositories.file_repository import FileRepository, clear_file_cache
+from backend.services.file_service import FileService
+from tests.database import open_database
+
+
+async def upload(file_service, file_repo, content: bytes, filename: str) -> File:
+    """Store an upload the way the /upload handler does, reusing stored content with the same hash"""
+    temp_path, file_hash, file_size = await file_service.stream_to_temp(
+        UploadFile(io.BytesIO(content), filename=filename, size=len(content))
+    )
+    existing_path = await file_repo.get_stored_path_by_hash(file_hash)
+    if existing_path:
+        file_service.discard_temp_file(temp_path)
+        file_path = existing_path
+    else:
+        file_path = file_service.store_temp_file(temp_path, filename, file_hash)
+    return await file_repo.create_file(filename, file_path, file_size, "text/plain", file_hash)
+
+
+async def delete(file_service, file_repo, file: File) -> bool:
+    """Delete a file record the way the DELETE handler does; returns whether storage was removed"""
+    await file_repo.delete_file(file.id)
+    if await file_repo.count_files_by_path(file.file_path) == 0:
+        return await file_service.delete_file(file.file_path)
+    return False
+
+
+def test_identical_uploads_share_storage_until_the_last_delete(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileService, "UPLOAD_DIR", tmp_path / "files")
+    clear_file_cache()
+
+    async def scenario():
+        async with open_database(tmp_path / "chat.db") as session_factory:
+            async with session_factory() as db:
+                file_service = FileService()
+                file_repo = FileRepository(db)
+
+                first = await upload(file_service, file_repo, b"same bytes" * 1000, "a.txt")
+                second = await upload(file_service, file_repo, b"same bytes" * 1000, "b.txt")
+                other = await upload(file_service, file_repo, b"other bytes", "a.txt")
+
+                assert second.file_path == first.file_path
+                assert other.file_path != first.file_path
+                assert first.hash_algorithm == "blake3"
+                # Only stored files are left behind, no temporary .part files
+                stored = {str(path) for path in (tmp_path / "files").rglob("*") if path.is_file()}
+                assert stored == {first.file_path, other.file_path}
+
+                # Stored content is kept while another record still points at it
+                assert await delete(file_service, file_repo, first) is False
+                assert await file_service.read_file(second.file_path) == b"same bytes" * 1000
+                assert await delete(file_service, file_repo, second) is True
+                assert await file_repo.get_stored_path_by_hash(second.file_hash) is None
+                assert await delete(file_service, file_repo, other) is True
+
+    asyncio.run(scenario())
+
+
+def test_hashes_from_another_algorithm_are_not_reused(tmp_path):
+    async def scenario():
+        async with open_database(tmp_path / "chat.db") as session_factory:
+            async with session_factory() as db:
+                file_repo = FileRepository(db)
+                legacy = await file_repo.create_file("old.txt", "uploads/old.txt", 3, "text/plain", "ab" * 32)
+                await file_repo.file_repo.update(legacy.id, hash_algorithm="sha256")
+
+                assert await file_repo.get_stored_path_by_hash("ab" * 32) is None
+                assert await file_repo.get_file_by_hash("ab" * 32) is None
+                assert not await file_repo.check_duplicate_exists("ab" * 32)
+
+    asyncio.run(scenario())
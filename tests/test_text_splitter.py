@@ -0,0 +1,41 @@
+import random
+
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from backend.services.rag.text_splitter import TextSplitter
+
+
+def sample_texts():
+    rng = random.Random(7)
+    words = ["cat", "purrs", "softly", "on", "the", "mat", "while", "rain", "falls", "outside"]
+    prose = "\n\n".join(
+        ". ".join(" ".join(rng.choice(words) for _ in range(rng.randint(3, 15))) for _ in range(rng.randint(1, 6)))
+        for _ in range(40)
+    )
+    return {
+        # The same sentence over and over: a search from the start of the text finds the wrong copy
+        "repetitive": "The cat sat on the mat. " * 300,
+        "prose": prose,
+        "unbroken": "x" * 2500,
+    }
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(1000, 200), (120, 40), (50, 10)])
+@pytest.mark.parametrize("name", sorted(sample_texts()))
+def test_chunk_offsets_point_at_their_text(name, chunk_size, chunk_overlap):
+    text = sample_texts()[name]
+    splitter = TextSplitter(chunk_size, chunk_overlap)
+    chunks = splitter.split_text(text, {"filename": "sample.txt"})
+
+    # LangChain tracks the same offsets when asked to
+    reference = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=TextSplitter.ENGLISH_SEPARATORS,
+        add_start_index=True
+    ).create_documents([text])
+
+    assert [chunk.start_char for chunk in chunks] == [document.metadata["start_index"] for document in reference]
+    for chunk in chunks:
+        assert text[chunk.start_char:chunk.end_char].strip() == chunk.content
+    assert [chunk.chunk_index for chunk in chunks] == list(range(len(chunks)))
+    assert all(later.start_char > earlier.start_char for earlier, later in zip(chunks, chunks[1:]))
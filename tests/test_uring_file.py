@@ -0,0 +1,139 @@
+import os
+import asyncio
+
+import pytest
+
+from backend.services import uring_file
+from backend.services.uring_file import UringFile, AlignedBuffer, ALIGNED_BUFFER_SIZE, DIRECT_IO_ALIGNMENT, open_file
+
+
+# Around the O_DIRECT block size and the staging buffer size
+SIZES = [
+    0, 1,
+    DIRECT_IO_ALIGNMENT - 1, DIRECT_IO_ALIGNMENT, DIRECT_IO_ALIGNMENT + 1,
+    ALIGNED_BUFFER_SIZE - 1, ALIGNED_BUFFER_SIZE, ALIGNED_BUFFER_SIZE + 1,
+    3 * ALIGNED_BUFFER_SIZE + DIRECT_IO_ALIGNMENT + 5,
+]
+
+
+async def write_then_read(path, data: bytes, direct: bool):
+    async with open_file(path, 'wb', direct=direct) as f:
+        # Uneven pieces so the staging buffer fills up mid-write
+        cut = len(data) // 3
+        await f.write(data[:cut])
+        await f.write(data[cut:])
+    async with open_file(path, 'rb') as f:
+        return await f.read()
+
+
+async def engine_available() -> bool:
+    return uring_file.get_uring_engine() is not None
+
+
+@pytest.fixture(scope="module")
+def uring_supported():
+    if not asyncio.run(engine_available()):
+        pytest.skip("io_uring is not usable here")
+
+
+@pytest.mark.parametrize("direct", [False, True])
+@pytest.mark.parametrize("size", SIZES)
+def test_uring_round_trip(tmp_path, uring_supported, size, direct):
+    data = os.urandom(size)
+    path = tmp_path / "data.bin"
+
+    assert asyncio.run(write_then_read(path, data, direct)) == data
+    assert path.stat().st_size == size
+
+
+@pytest.mark.parametrize("size", [0, DIRECT_IO_ALIGNMENT + 1, ALIGNED_BUFFER_SIZE + 1])
+def test_falls_back_to_aiofiles(tmp_path, monkeypatch, size):
+    monkeypatch.setattr(uring_file, "get_uring_engine", lambda: None)
+    data = os.urandom(size)
+
+    async def scenario():
+        async with open_file(tmp_path / "probe.bin", 'wb') as f:
+            assert not isinstance(f, UringFile)
+        return await write_then_read(tmp_path / "data.bin", data, direct=True)
+
+    assert asyncio.run(scenario()) == data
+
+
+class ControlledEngine:
+    """Engine stand-in whose operations complete only when the test says so"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.operations = []
+        self.released = []
+
+    def write(self, fd, data, offset):
+        return self._operation()
+
+    def write_aligned(self, fd, buffer, length, offset):
+        return self._operation()
+
+    def acquire_buffer(self):
+        return AlignedBuffer(ALIGNED_BUFFER_SIZE)
+
+    def release_buffer(self, buffer):
+        self.released.append(buffer)
+
+    def _operation(self):
+        future = self.loop.create_future()
+        self.operations.append(future)
+        return future
+
+
+async def start_cancelled_write(path):
+    """Cancel a writer while its first write is still owned by the kernel"""
+    engine = ControlledEngine()
+    f = UringFile(path, 'wb', engine, direct=True)
+
+    async def writer():
+        async with f:
+            await f.write(bytes(ALIGNED_BUFFER_SIZE))
+
+    task = asyncio.create_task(writer())
+    while not engine.operations:
+        await asyncio.sleep(0)
+    task.cancel()
+    for _ in range(5):
+        await asyncio.sleep(0)
+    return engine, f, task
+
+
+def test_cancelled_write_keeps_buffer_and_fd_until_completion(tmp_path):
+    async def scenario():
+        engine, f, task = await start_cancelled_write(tmp_path / "data.bin")
+        staging = f._staging
+
+        # __aexit__ is waiting for the operation instead of releasing under it
+        assert not task.done()
+        assert f.fd is not None and engine.released == []
+
+        engine.operations[0].set_result(ALIGNED_BUFFER_SIZE)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert f.fd is None
+        assert engine.released == ([staging] if staging is not None else [])
+        assert len(engine.operations) == 1
+
+    asyncio.run(scenario())
+
+
+def test_repeated_cancel_defers_release_to_completion(tmp_path):
+    async def scenario():
+        engine, f, task = await start_cancelled_write(tmp_path / "data.bin")
+        fd = f.fd
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert f.fd == fd and engine.released == []
+
+        engine.operations[0].set_result(ALIGNED_BUFFER_SIZE)
+        await asyncio.sleep(0)
+        assert f.fd is None
+
+    asyncio.run(scenario())